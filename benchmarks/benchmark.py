@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# Benchmarks hot paths of the extension against synthetic server_profiles folders.
+#
+# Runs headless: ulauncher is replaced by minimal stand-ins before main.py is imported and notifications
+# go to a null backend.
+# Usage: python benchmarks/benchmark.py [--sizes 1000,10000,100000] [--repeat 5] [--output results.json]
+import os
+import sys
+import json
+import time
+import types
+import random
+import shutil
+import argparse
+import platform
+import statistics
+import tempfile
+import subprocess as sp
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Registers stand-in ulauncher modules, so main.py can be imported without Ulauncher
+def install_stub_modules():
+    class Stub:
+        def __init__(self, *args, **kwargs):
+            self.args = args
+            self.kwargs = kwargs
+
+    class Extension:
+        def __init__(self):
+            self.listeners = {}
+
+        def subscribe(self, event_type, listener):
+            self.listeners[event_type] = listener
+
+    modules = {
+        "ulauncher": {},
+        "ulauncher.api": {},
+        "ulauncher.api.client": {},
+        "ulauncher.api.client.Extension": {"Extension": Extension},
+        "ulauncher.api.client.EventListener": {"EventListener": object},
+        "ulauncher.api.shared": {},
+        "ulauncher.api.shared.event": {
+            name: type(name, (Stub,), {})
+            for name in ("KeywordQueryEvent", "ItemEnterEvent", "PreferencesEvent", "PreferencesUpdateEvent")
+        },
+        "ulauncher.api.shared.item": {},
+        "ulauncher.api.shared.item.ExtensionResultItem": {"ExtensionResultItem": type("ExtensionResultItem", (Stub,), {})},
+        "ulauncher.api.shared.action": {},
+    }
+    for action in ("RenderResultListAction", "HideWindowAction", "SetUserQueryAction", "ExtensionCustomAction"):
+        modules[f"ulauncher.api.shared.action.{action}"] = {action: type(action, (Stub,), {})}
+
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules.setdefault(name, module)
+
+
+# Returns profile names for a catalog of the given size: regular, -st0N, -mp0N and IP-named profiles
+def generate_profile_names(size, server_codes, seed=0):
+    rng = random.Random(seed)
+    names = []
+    for i in range(size):
+        code = server_codes[i % len(server_codes)]
+        proto = "tcp" if i % 2 else "udp"
+        kind = rng.random()
+        if kind < 0.1:
+            # Unknown codes exercise the missing-mapping path
+            suffix = "" if i < 2 * len(server_codes) else f"-x{i}"
+            names.append(f"{code}{suffix}.prod.surfshark.com_{proto}.ovpn")
+        elif kind < 0.5:
+            names.append(f"{code}-st0{i}.prod.surfshark.com_{proto}.ovpn")
+        elif kind < 0.9:
+            names.append(f"{code}-mp0{i}.prod.surfshark.com_{proto}.ovpn")
+        else:
+            names.append(f"{(i >> 16) % 223 + 1}.{(i >> 8) & 255}.{i & 255}.{rng.randint(1, 254)}_{proto}.ovpn")
+    return list(dict.fromkeys(names))
+
+
+# Creates synthetic server_profiles folder and returns its path
+def create_profiles_folder(base_path, names):
+    profiles_path = os.path.join(base_path, "server_profiles")
+    os.mkdir(profiles_path)
+    for name in names:
+        host = name.rsplit("_", 1)[0]
+        proto = "tcp" if name.endswith("_tcp.ovpn") else "udp"
+        with open(os.path.join(profiles_path, name), "w") as profile:
+            profile.write(
+                f"client\ndev tun\nproto {proto}\nremote {host} {1443 if proto == 'tcp' else 1194}\n"
+                "remote-random\nnobind\ncipher AES-256-CBC\nauth SHA512\nverb 3\n"
+            )
+    return profiles_path
+
+
+# Creates fake proc folder with some processes and one running openvpn connection
+def create_proc_folder(base_path, openvpn_path, profiles_path, profile_name, process_count=300):
+    proc_path = os.path.join(base_path, "proc")
+    for pid in range(1, process_count + 1):
+        os.makedirs(os.path.join(proc_path, str(pid)))
+        args = [f"/usr/bin/process-{pid}", "--flag"]
+        if pid == process_count:
+            args = [openvpn_path, "--config", os.path.join(profiles_path, profile_name), "--auth-user-pass", "x"]
+        with open(os.path.join(proc_path, str(pid), "cmdline"), "wb") as cmdline:
+            cmdline.write("\0".join(args).encode() + b"\0")
+    os.makedirs(os.path.join(proc_path, "self"))
+    return proc_path
+
+
+# Runs func repeat times and returns timing summary in milliseconds
+def measure(func, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": min(samples),
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.mean(samples),
+        "max_ms": max(samples),
+    }
+
+
+def run_size(main, size, repeat, queries):
+    base_path = tempfile.mkdtemp(prefix=f"surf-bench-{size}-")
+    try:
+        with open(os.path.join(REPO_PATH, "server_country_map.json")) as mapping_file:
+            server_codes = [d["code"] for d in json.load(mapping_file)]
+        names = generate_profile_names(size, server_codes)
+        profiles_path = create_profiles_folder(base_path, names)
+        catalog_path = os.path.join(base_path, "server_catalog.cache")
+
+        def remove_catalog():
+            if os.path.exists(catalog_path):
+                os.remove(catalog_path)
+
+        results = {}
+        results["surf_init_cold"] = measure(lambda: main.Surf(profiles_path), repeat, setup=remove_catalog)
+        main.Surf(profiles_path)
+        results["surf_init_cached"] = measure(lambda: main.Surf(profiles_path), repeat)
+
+        surf = main.Surf(profiles_path)
+        surf.credentials = main.CredentialStore(os.path.join(base_path, "service_credentials.conf"))
+        # Latency probes would measure the network, not the extension
+        surf.schedule_latency_probe = lambda servers: None
+        surf.tunnel_sampler.rtt_probe = lambda profile_name: None
+        results["refresh_server_list"] = measure(surf.refresh_server_list, repeat)
+        results["get_server_details"] = measure(lambda: [surf.get_server_details(n) for n in names], repeat)
+
+        surf.load_server_list()
+        results["get_fuzzy_index[Static-IP UDP]"] = measure(
+            lambda: surf.get_fuzzy_index("Static-IP UDP"), repeat, setup=lambda: setattr(surf, "fuzzy_index_generation", None)
+        )
+
+        extension = main.SurfExtension(surf, use_daemon=False)
+        extension.max_server_entries = 10
+        extension.uname, extension.passwd = "username", "password"
+
+        for server_type in ("udp", "st_tcp", "mp_udp"):
+            for query in queries:
+                label = f"{server_type}:{query or '<empty>'}"
+                group = server_type.split("_")[0] if "_" in server_type else "reg"
+                protocol = server_type.split("_")[-1]
+                results[f"filter_server_list[{label}]"] = measure(
+                    lambda: extension.filter_server_list(query, protocol, group), repeat
+                )
+                # Query cache serves repeated queries, so cold and cached lookups are timed separately
+                results[f"get_server_result_items_cold[{label}]"] = measure(
+                    lambda: extension.get_server_result_items(query, server_type), repeat, setup=extension.query_cache.clear
+                )
+                results[f"get_server_result_items_cached[{label}]"] = measure(
+                    lambda: extension.get_server_result_items(query, server_type), repeat
+                )
+                results[f"fuzzy_search[{label}]"] = measure(
+                    lambda: surf.search(query, group, protocol, fuzzy=True, limit=extension.max_server_entries), repeat
+                )
+
+        openvpn_path = "/usr/sbin/openvpn"
+        proc_path = create_proc_folder(base_path, openvpn_path, profiles_path, names[0])
+        surf.status_provider = main.StatusProvider(openvpn_path, proc_path)
+        results["get_status_uncached"] = measure(surf.get_status, repeat, setup=surf.status_provider.invalidate)
+        results["get_status_cached"] = measure(surf.get_status, repeat)
+
+        return {"size": size, "profiles": len(names), "results": results}
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+
+# Returns current git revision of the repository, None outside of a checkout
+def get_revision():
+    try:
+        return sp.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_PATH, stderr=sp.DEVNULL).decode().strip()
+    except (OSError, sp.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Surfshark extension hot paths")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma separated catalog sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement")
+    parser.add_argument("--queries", default=",g,ger,germany,new york,zz", help="comma separated search queries")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    install_stub_modules()
+    sys.path.insert(0, REPO_PATH)
+    import main as surf_main
+    surf_main.Utils.notification_service = surf_main.NotificationService(surf_main.NullBackend())
+
+    report = {
+        "revision": get_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "runs": [
+            run_size(surf_main, int(size), args.repeat, args.queries.split(","))
+            for size in args.sizes.split(",")
+        ],
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
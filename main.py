@@ -1,11 +1,43 @@
 import os
 import os.path
+import sys
+import enum
+import errno
 import json
 import re
+import unicodedata
+import math
+import bisect
+import heapq
+import itertools
+import threading
+import queue
+import collections
+import functools
+import contextlib
+import asyncio
+import socket
+import socketserver
+import argparse
+import ipaddress
+import shutil
+import tempfile
+import zipfile
+import http.client
+import urllib.request
+import urllib.error
+import select
+import struct
+import ctypes
+import ctypes.util
 import pathlib
+import pickle
+import hashlib
 import time
+import shlex
+import mmap
+import getpass
 import subprocess as sp
-from gi.repository import Notify
 from ulauncher.api.client.Extension import Extension
 from ulauncher.api.client.EventListener import EventListener
 from ulauncher.api.shared.event import (
@@ -22,23 +54,48 @@ from ulauncher.api.shared.action.ExtensionCustomAction import ExtensionCustomAct
 
 
 class Utils:
+    notification_service = None # shared NotificationService, created on first notification
+    notification_lock = threading.Lock()
+    # renameat2 arguments, for swapping paths in a single step
+    AT_FDCWD = -100
+    RENAME_EXCHANGE = 2
+
     # Returns absolute path
     @staticmethod
     def get_path(filename):
         current_dir = pathlib.Path(__file__).parent.absolute()
         return f"{current_dir}/{filename}"
     
-    # Show GUI notification
+    # Returns path of a socket in the user's runtime folder
+    @staticmethod
+    def get_runtime_path(filename):
+        return os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), filename)
+
+    # Swaps two existing paths atomically, returns False if the system or file system cannot do that
     @staticmethod
-    def notify(title, message):
-        Notify.init("SurfsharkVPNExt")
-        notification = Notify.Notification.new(
-            title,
-            message,
-            Utils.get_path("images/icon.svg"),
+    def exchange_paths(path, other_path):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            renameat2 = libc.renameat2
+        except (OSError, AttributeError):
+            return False # glibc older than 2.28
+        result = renameat2(
+            Utils.AT_FDCWD, os.fsencode(path), Utils.AT_FDCWD, os.fsencode(other_path), Utils.RENAME_EXCHANGE
         )
-        notification.set_timeout(1000)
-        notification.show()
+        if result == 0:
+            return True
+        error = ctypes.get_errno()
+        if error in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            return False
+        raise OSError(error, os.strerror(error), path)
+
+    # Show GUI notification, replacing the previous one of the same channel
+    @staticmethod
+    def notify(title, message, channel="default"):
+        with Utils.notification_lock:
+            if not Utils.notification_service:
+                Utils.notification_service = NotificationService(LibnotifyBackend())
+        Utils.notification_service.notify(title, message, channel)
     
     # Returns list of available server connection types and corresponding action keyword
     @staticmethod
@@ -73,12 +130,1343 @@ class Utils:
                 "name": "Multipoint TCP",
                 "description": "Connect to VPN with Multipoint TCP",
                 "action": "mp_tcp"
+            },
+            {
+                "name": "Fastest",
+                "description": "Connect to VPN server with the lowest latency - UDP or TCP",
+                "action": "fastest"
             }
         ]
         return available_conn_types
 
+    # Returns human readable transfer rate
+    @staticmethod
+    def format_rate(bytes_per_second):
+        for unit in ("B/s", "kB/s", "MB/s"):
+            if bytes_per_second < 1000:
+                return f"{bytes_per_second:.0f} {unit}" if unit == "B/s" else f"{bytes_per_second:.1f} {unit}"
+            bytes_per_second /= 1000
+        return f"{bytes_per_second:.1f} GB/s"
+
+
+class LibnotifyBackend:
+    app_name = "SurfsharkVPNExt"
+
+    def __init__(self, timeout=1000):
+        self.timeout = timeout # milliseconds a notification is shown
+        self.notify = None # gi Notify module, initialized with first notification
+        self.notifications = {} # channel -> notification updated in place
+
+    # Shows message as notification of the channel
+    def show(self, channel, title, message):
+        if not self.notify:
+            # Imported on first notification, keeps gi out of extension startup
+            from gi.repository import Notify
+            Notify.init(self.app_name)
+            self.notify = Notify
+        notification = self.notifications.get(channel)
+        if notification:
+            notification.update(title, message, Utils.get_path("images/icon.svg"))
+        else:
+            notification = self.notify.Notification.new(title, message, Utils.get_path("images/icon.svg"))
+            notification.set_timeout(self.timeout)
+            self.notifications[channel] = notification
+        notification.show()
+
+
+class NullBackend:
+    def __init__(self, max_messages=100):
+        self.messages = collections.deque(maxlen=max_messages) # (channel, title, message) shown so far
+
+    # Keeps message instead of showing it, for running without a desktop session
+    def show(self, channel, title, message):
+        self.messages.append((channel, title, message))
+
+
+class NotificationService:
+    def __init__(self, backend, coalesce_delay=0.1):
+        self.backend = backend # shows (channel, title, message), e.g. LibnotifyBackend or NullBackend
+        self.coalesce_delay = coalesce_delay # seconds to collect a burst before showing the latest message per channel
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+
+    # Queues message for the channel, returns without waiting for it to be shown
+    def notify(self, title, message, channel="default"):
+        self.queue.put((channel, title, message))
+        with self.lock:
+            if not self.worker or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.run, name="SurfNotifications", daemon=True)
+                self.worker.start()
+
+    def run(self):
+        while True:
+            pending = collections.OrderedDict() # channel -> latest (title, message)
+            channel, title, message = self.queue.get()
+            pending[channel] = (title, message)
+            taken = 1
+            time.sleep(self.coalesce_delay)
+            # Later messages of a burst replace earlier ones of the same channel
+            while True:
+                try:
+                    channel, title, message = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.pop(channel, None)
+                pending[channel] = (title, message)
+                taken += 1
+            for channel, (title, message) in pending.items():
+                try:
+                    self.backend.show(channel, title, message)
+                except Exception:
+                    None # Notifications are best effort, e.g. without a D-Bus session
+            for _ in range(taken):
+                self.queue.task_done()
+
+    # Waits until queued messages were shown
+    def flush(self):
+        self.queue.join()
+
+
+class Stats:
+    def __init__(self, max_samples=512, log_path=None):
+        self.max_samples = max_samples # most recent samples kept per stage
+        self.log_path = log_path # JSON-lines file samples are exported to, if set
+        self.lock = threading.Lock()
+        self.samples = {} # stage -> recent durations in seconds
+        self.counters = {} # cache name -> {outcome: count}
+        self.pending_lines = [] # exported samples not yet written to log file
+
+    # Records duration of a stage
+    def record(self, stage, duration):
+        with self.lock:
+            if stage not in self.samples:
+                self.samples[stage] = collections.deque(maxlen=self.max_samples)
+            self.samples[stage].append(duration)
+            if self.log_path:
+                self.pending_lines.append(json.dumps({"time": time.time(), "stage": stage, "ms": duration * 1000}))
+                if len(self.pending_lines) >= 64:
+                    self.flush_locked()
+
+    # Counts outcome (e.g. hit or miss) of a cache lookup
+    def count(self, cache_name, outcome):
+        with self.lock:
+            counter = self.counters.setdefault(cache_name, {})
+            counter[outcome] = counter.get(outcome, 0) + 1
+
+    # Measures duration of the enclosed block as a stage
+    @contextlib.contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    # Decorates event listener on_event method to measure it as a stage
+    @staticmethod
+    def timed_event(stage):
+        def decorator(on_event):
+            @functools.wraps(on_event)
+            def timed_on_event(listener, event, extension, *args):
+                with extension.surf.stats.timed(stage):
+                    return on_event(listener, event, extension, *args)
+            return timed_on_event
+        return decorator
+
+    # Writes exported samples to log file
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        lines, self.pending_lines = self.pending_lines, []
+        if not lines or not self.log_path:
+            return
+        try:
+            with open(self.log_path, "a") as log_file:
+                log_file.write("\n".join(lines) + "\n")
+        except OSError:
+            None # Export is best effort, samples stay available in memory
+
+    # Returns (stage, sample count, p50, p95, max) in seconds for every recorded stage
+    def get_latency_summary(self):
+        with self.lock:
+            samples = {stage: sorted(durations) for stage, durations in self.samples.items()}
+        summary = []
+        for stage, durations in sorted(samples.items()):
+            def percentile(q):
+                return durations[min(len(durations) - 1, int(round(q * (len(durations) - 1))))]
+            summary.append((stage, len(durations), percentile(0.5), percentile(0.95), durations[-1]))
+        return summary
+
+    # Returns (cache name, hit rate, outcome counts) for every counted cache
+    def get_cache_summary(self):
+        with self.lock:
+            counters = {name: dict(counter) for name, counter in self.counters.items()}
+        summary = []
+        for name, counter in sorted(counters.items()):
+            total = sum(counter.values())
+            # Counters without misses (e.g. dropped queries) have no hit rate
+            hit_rate = (total - counter.get("miss", 0)) / total if "hit" in counter or "miss" in counter else None
+            summary.append((name, hit_rate, counter))
+        return summary
+
+
+class UsageStore:
+    half_life = 7 * 24 * 3600 # seconds after which a connection counts half as much
+
+    def __init__(self, path):
+        self.path = path # JSON-lines file connections are appended to
+        self.lock = threading.Lock()
+        self.scores = None # profile name -> log of decayed connection count, loaded on first use
+        self.line_count = 0 # lines in usage file, compacted when mostly redundant
+        self.generation = 0 # changes whenever a connection is recorded
+
+    # Returns log weight of a connection made at the given time
+    def get_log_weight(self, timestamp):
+        # Newer connections weigh exponentially more instead of older ones decaying,
+        # so scores never need to be recomputed and are kept in log space to not overflow
+        return timestamp * math.log(2) / self.half_life
+
+    # Returns log(exp(a) + exp(b)), a may be None
+    @staticmethod
+    def log_add(a, b):
+        if a is None:
+            return b
+        high, low = max(a, b), min(a, b)
+        return high + math.log1p(math.exp(low - high))
+
+    # Reads usage file into scores, unless already loaded
+    def load_locked(self):
+        if self.scores is not None:
+            return
+        scores = {}
+        line_count = 0
+        try:
+            with open(self.path, "r") as usage_file:
+                for line in usage_file:
+                    try:
+                        entry = json.loads(line)
+                        scores[entry["profile"]] = self.log_add(scores.get(entry["profile"]), float(entry["weight"]))
+                    except (ValueError, KeyError, TypeError):
+                        continue # partially written line
+                    line_count += 1
+        except OSError:
+            None # No connections recorded yet
+        self.scores = scores
+        self.line_count = line_count
+        if self.line_count > 2 * len(self.scores) + 64:
+            self.compact_locked()
+
+    # Rewrites usage file with a single line per profile
+    def compact_locked(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as usage_file:
+                for profile_name, score in self.scores.items():
+                    usage_file.write(json.dumps({"profile": profile_name, "weight": score}) + "\n")
+            os.replace(temp_path, self.path)
+            self.line_count = len(self.scores)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # Records a connection to profile
+    def record(self, profile_name, timestamp=None):
+        weight = self.get_log_weight(timestamp or time.time())
+        with self.lock:
+            self.load_locked()
+            self.scores[profile_name] = self.log_add(self.scores.get(profile_name), weight)
+            self.generation += 1
+            try:
+                with open(self.path, "a") as usage_file:
+                    usage_file.write(json.dumps({"profile": profile_name, "weight": weight}) + "\n")
+                self.line_count += 1
+            except OSError:
+                None # Ranking still uses the connection until extension restarts
+
+    # Returns up to count servers with the highest frecency, used servers only
+    def get_top(self, servers, count):
+        with self.lock:
+            self.load_locked()
+            scores = self.scores
+        if not scores:
+            return []
+        return heapq.nlargest(
+            count, (s for s in servers if s.server_profile in scores), key=lambda s: scores[s.server_profile]
+        )
+
+    # Returns used profile names, highest frecency first
+    def get_ranked_profiles(self):
+        with self.lock:
+            self.load_locked()
+            return sorted(self.scores, key=self.scores.get, reverse=True)
+
+
+class ConnectionType(enum.Enum):
+    UDP = "UDP"
+    TCP = "TCP"
+    ST_UDP = "Static-IP UDP"
+    ST_TCP = "Static-IP TCP"
+    MP_UDP = "Multi-Point UDP"
+    MP_TCP = "Multi-Point TCP"
+
+    # Returns connection type for its label, cheaper than ConnectionType(label) on hot paths
+    @classmethod
+    def from_label(cls, label):
+        return cls._value2member_map_[label]
+
+
+class ServerRecord:
+    __slots__ = ("country", "city", "alt_word", "flag_file", "conn_type", "server_profile", "search_keys")
+
+    def __init__(self, country, city, alt_word, flag_file, conn_type, server_profile):
+        # Country, city and flag names repeat across profiles, share a single copy of each
+        self.country = sys.intern(country)
+        self.city = sys.intern(city)
+        self.alt_word = sys.intern(alt_word)
+        self.flag_file = sys.intern(flag_file)
+        self.conn_type = conn_type
+        self.server_profile = server_profile
+        # Lowercased country, alt search word and city, as matched by search queries
+        self.search_keys = tuple({sys.intern(country.lower()), sys.intern(alt_word.lower()), city.lower()})
+
+    # Allows server["country"] style access used by result rendering
+    def __getitem__(self, key):
+        if key == "conn_type":
+            return self.conn_type.value
+        if key == "search_keys" or key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    # Returns record as plain data, for the catalog cache
+    def to_tuple(self):
+        return (self.country, self.city, self.alt_word, self.flag_file, self.conn_type.value, self.server_profile, self.search_keys)
+
+    # Creates record from data returned by to_tuple, without computing search keys again
+    @classmethod
+    def from_tuple(cls, data):
+        record = cls.__new__(cls)
+        (record.country, record.city, record.alt_word, record.flag_file,
+         conn_type, record.server_profile, record.search_keys) = data
+        record.conn_type = ConnectionType.from_label(conn_type)
+        return record
+
+    # Returns record as JSON serializable dict, for the daemon API
+    def to_dict(self):
+        return {
+            "country": self.country,
+            "city": self.city,
+            "alt_word": self.alt_word,
+            "flag_file": self.flag_file,
+            "conn_type": self.conn_type.value,
+            "server_profile": self.server_profile,
+        }
+
+    # Creates record from dict returned by to_dict, extra keys are ignored
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["country"],
+            data["city"],
+            data["alt_word"],
+            data["flag_file"],
+            ConnectionType.from_label(data["conn_type"]),
+            data["server_profile"],
+        )
+
+
+class ServerIndex:
+    # Upper bound used to turn a prefix into a sorted-key range
+    prefix_end = chr(0x10FFFF)
+
+    def __init__(self):
+        self.keys = [] # sorted (token, seq) pairs over pre-lowercased search fields
+        self.records = {} # seq -> server object, in insertion order
+        self.sequences = {} # server profile -> seq
+
+    # Returns lowercased tokens a server object can be found by
+    @staticmethod
+    def get_tokens(server):
+        return server.search_keys
+
+    # Adds server object to index using the provided sequence number
+    def add(self, server, seq):
+        if server.server_profile in self.sequences:
+            return
+        self.records[seq] = server
+        self.sequences[server.server_profile] = seq
+        for token in self.get_tokens(server):
+            bisect.insort(self.keys, (token, seq))
+
+    # Adds (seq, server) pairs to index, sorting keys once instead of inserting each of them
+    def extend(self, numbered_servers):
+        for seq, server in numbered_servers:
+            if server.server_profile in self.sequences:
+                continue
+            self.records[seq] = server
+            self.sequences[server.server_profile] = seq
+            self.keys.extend((token, seq) for token in self.get_tokens(server))
+        self.keys.sort()
+
+    # Removes server object with the given profile name from index
+    def remove(self, profile_name):
+        seq = self.sequences.pop(profile_name, None)
+        if seq is None:
+            return
+        server = self.records.pop(seq)
+        for token in self.get_tokens(server):
+            pos = bisect.bisect_left(self.keys, (token, seq))
+            if pos < len(self.keys) and self.keys[pos] == (token, seq):
+                del self.keys[pos]
+
+    # Returns index contents as plain data, for the catalog cache
+    def get_state(self):
+        return self.keys, [(seq, server.to_tuple()) for seq, server in self.records.items()]
+
+    # Creates index from data returned by get_state
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.keys, records = state
+        for seq, data in records:
+            server = ServerRecord.from_tuple(data)
+            index.records[seq] = server
+            index.sequences[server.server_profile] = seq
+        return index
+
+    # Returns (seq, server) pairs whose country, city or alt search word starts with query
+    def search(self, query):
+        if not query:
+            return list(self.records.items())
+
+        start = bisect.bisect_left(self.keys, (query,))
+        end = bisect.bisect_right(self.keys, (query + self.prefix_end,))
+        matches = sorted({seq for _, seq in self.keys[start:end]})
+        return [(seq, self.records[seq]) for seq in matches]
+
+    # Returns (seq, server) pairs having exactly the given token, lazily in seq order
+    def get_token_records(self, token):
+        start = bisect.bisect_left(self.keys, (token,))
+        end = bisect.bisect_right(self.keys, (token, math.inf))
+        return ((self.keys[pos][1], self.records[self.keys[pos][1]]) for pos in range(start, end))
+
+    def __len__(self):
+        return len(self.records)
+
+
+class FuzzyIndex:
+    gram_size = 3
+    prefix_bonus = 1.0 # added to names starting with the query, so they rank above all misspelled matches
+    min_score = 0.5 # n-gram similarity below which a name is not a match
+
+    def __init__(self):
+        self.names = [] # normalized names, position is the name id
+        self.gram_counts = [] # name id -> number of distinct n-grams of the name
+        self.tokens = [] # name id -> search index tokens with that normalized name
+        self.name_ids = {} # normalized name -> name id
+        self.postings = {} # n-gram -> ids of names containing it
+
+    # Returns case-folded text without accents and trailing server numbers, e.g. "São Paulo 02" -> "sao paulo"
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def normalize(text):
+        decomposed = unicodedata.normalize("NFKD", text.casefold())
+        stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+        return " ".join(stripped.split()).rstrip("0123456789 ")
+
+    # Returns n-grams of text, padded so that its start and short texts have n-grams too
+    @classmethod
+    def get_grams(cls, text):
+        padded = " " * (cls.gram_size - 1) + text + " "
+        return {padded[i:i + cls.gram_size] for i in range(len(padded) - cls.gram_size + 1)}
+
+    # Adds search index token under its normalized name
+    def add(self, token):
+        # Numbered servers of a city share the cached name
+        name = self.normalize(token.rstrip("0123456789 "))
+        if not name:
+            return
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            name_id = self.name_ids[name] = len(self.names)
+            grams = self.get_grams(name)
+            self.names.append(name)
+            self.gram_counts.append(len(grams))
+            self.tokens.append([])
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(name_id)
+        self.tokens[name_id].append(token)
+
+    # Creates index over distinct tokens of a search index
+    @classmethod
+    def from_server_index(cls, server_index):
+        index = cls()
+        for token in dict.fromkeys(key[0] for key in server_index.keys):
+            index.add(token)
+        return index
+
+    # Returns (score, name id) of names similar to query, best first
+    def search(self, query):
+        text = self.normalize(query)
+        if not text:
+            return []
+        grams = self.get_grams(text)
+        overlaps = collections.Counter()
+        for gram in grams:
+            overlaps.update(self.postings.get(gram, ()))
+
+        matches = []
+        for name_id, overlap in overlaps.items():
+            # Dice coefficient of the n-gram sets, 1.0 for the same name
+            score = 2 * overlap / (len(grams) + self.gram_counts[name_id])
+            if self.names[name_id].startswith(text):
+                score += self.prefix_bonus
+            if score >= self.min_score:
+                matches.append((score, name_id))
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return matches
+
+    def __len__(self):
+        return len(self.names)
+
+
+class ProfileMetadata:
+    __slots__ = ("remotes", "ciphers")
+    # Directives at line start, values end at line break or comment
+    directive_pattern = re.compile(rb"^[ \t]*(remote|proto|cipher|data-ciphers)[ \t]+([^\r\n#;]*)", re.M)
+    filter_keys = ("port", "host", "proto", "cipher")
+
+    def __init__(self, remotes, ciphers):
+        self.remotes = remotes # (host, port, proto) of each remote directive, in profile order
+        self.ciphers = ciphers # cipher and data-ciphers names
+
+    # Parses directives of an open ovpn profile through mmap, without reading it into a string
+    @classmethod
+    def parse(cls, profile_file, default_proto):
+        if not os.fstat(profile_file.fileno()).st_size:
+            return cls((), ())
+        with mmap.mmap(profile_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            directives = [
+                (match.group(1), match.group(2).decode("utf-8", "replace").split())
+                for match in cls.directive_pattern.finditer(data)
+            ]
+
+        proto = default_proto
+        remotes = []
+        ciphers = []
+        for directive, args in directives:
+            if not args:
+                continue
+            if directive == b"proto":
+                proto = "tcp" if args[0].startswith("tcp") else "udp"
+            elif directive == b"remote":
+                port = int(args[1]) if len(args) > 1 and args[1].isdigit() else 1194
+                remotes.append((args[0], port, ("tcp" if args[2].startswith("tcp") else "udp") if len(args) > 2 else None))
+            elif directive == b"cipher":
+                ciphers.append(sys.intern(args[0]))
+            else:
+                ciphers.extend(sys.intern(name) for name in args[0].split(":"))
+        # Remotes without own proto use the proto directive, wherever it is placed
+        remotes = tuple((host, port, remote_proto or proto) for host, port, remote_proto in remotes)
+        return cls(remotes, tuple(dict.fromkeys(ciphers)))
+
+    # Returns lowercased values a query filter (port, host, proto or cipher) is matched against
+    def get_filter_values(self, key):
+        if key == "port":
+            return [str(port) for _, port, _ in self.remotes]
+        if key == "host":
+            return [host.lower() for host, _, _ in self.remotes]
+        if key == "proto":
+            return [proto for _, _, proto in self.remotes]
+        if key == "cipher":
+            return [cipher.lower() for cipher in self.ciphers]
+        return []
+
+    # Checks if profile matches all (key, value prefix) query filters
+    def matches(self, filters):
+        return all(
+            any(candidate.startswith(value) for candidate in self.get_filter_values(key))
+            for key, value in filters
+        )
+
+
+class ProfileMetadataIndex:
+    def __init__(self):
+        self.entries = {} # profile name -> ((inode, mtime, size), ProfileMetadata)
+
+    # Returns proto implied by profile name, for profiles without proto directive
+    @staticmethod
+    def get_default_proto(profile_name):
+        return "tcp" if "tcp.ovpn" in profile_name else "udp"
+
+    # Returns indexed metadata of profile, None if it was not scanned yet
+    def get(self, profile_name):
+        entry = self.entries.get(profile_name)
+        return entry[1] if entry else None
+
+    # Parses a single profile into index, returns its metadata or None if it cannot be read
+    def scan(self, dir_path, profile_name):
+        try:
+            with open(os.path.join(dir_path, profile_name), "rb") as profile_file:
+                stat = os.fstat(profile_file.fileno())
+                metadata = ProfileMetadata.parse(profile_file, self.get_default_proto(profile_name))
+        except (OSError, ValueError):
+            return None
+        self.entries[profile_name] = ((stat.st_ino, stat.st_mtime_ns, stat.st_size), metadata)
+        return metadata
+
+    # Syncs index with the listed profiles, parsing only new or changed files, returns True if index changed
+    def update(self, dir_path, profile_names):
+        entries = {}
+        changed = False
+        for profile_name in profile_names:
+            try:
+                stat = os.stat(os.path.join(dir_path, profile_name))
+            except OSError:
+                continue
+            entry = self.entries.get(profile_name)
+            if entry and entry[0] == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                entries[profile_name] = entry
+            elif self.scan(dir_path, profile_name):
+                entries[profile_name] = self.entries[profile_name]
+                changed = True
+        # Profiles no longer listed are dropped
+        changed = changed or entries.keys() != self.entries.keys()
+        self.entries = entries
+        return changed
+
+    # Returns index contents as plain data, for the catalog cache
+    def get_state(self):
+        return [
+            (profile_name, key, metadata.remotes, metadata.ciphers)
+            for profile_name, (key, metadata) in self.entries.items()
+        ]
+
+    # Creates index from data returned by get_state
+    @classmethod
+    def from_state(cls, state):
+        index = cls()
+        index.entries = {
+            profile_name: (key, ProfileMetadata(remotes, ciphers)) for profile_name, key, remotes, ciphers in state
+        }
+        return index
+
+
+class ProfileManifest:
+    def __init__(self):
+        self.entries = {} # profile name -> (size, mtime, sha1 digest of contents)
+        self.names_by_digest = collections.defaultdict(set) # sha1 digest -> names of non-empty profiles with it
+        self.touched_digests = set() # digests gaining or losing profiles since clear_touched
+        self.touched_names = set() # profiles added, rehashed or dropped since clear_touched
+
+    # Stores entry of profile, keeping profiles grouped by digest
+    def set_entry(self, profile_name, entry):
+        self.drop_entry(profile_name)
+        self.entries[profile_name] = entry
+        self.touched_names.add(profile_name)
+        # Empty profiles are never duplicates
+        if entry[0]:
+            self.names_by_digest[entry[2]].add(profile_name)
+            self.touched_digests.add(entry[2])
+
+    def drop_entry(self, profile_name):
+        entry = self.entries.pop(profile_name, None)
+        if not entry:
+            return
+        self.touched_names.add(profile_name)
+        if entry[0]:
+            names = self.names_by_digest[entry[2]]
+            names.discard(profile_name)
+            if not names:
+                del self.names_by_digest[entry[2]]
+            self.touched_digests.add(entry[2])
+
+    # Returns digest of profile contents, hashing the file only if its size or mtime changed
+    def get_digest(self, dir_path, profile_name, stat=None):
+        profile_path = os.path.join(dir_path, profile_name)
+        try:
+            stat = stat or os.stat(profile_path)
+            entry = self.entries.get(profile_name)
+            if entry and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                return entry[2]
+            with open(profile_path, "rb") as profile_file:
+                digest = hashlib.sha1(profile_file.read()).digest()
+        except OSError:
+            self.drop_entry(profile_name)
+            return None
+        self.set_entry(profile_name, (stat.st_size, stat.st_mtime_ns, digest))
+        return digest
+
+    # Checks if size and mtime of profile are still the ones its digest was computed for
+    def is_current(self, dir_path, profile_name):
+        entry = self.entries.get(profile_name)
+        if not entry:
+            return False
+        try:
+            stat = os.stat(os.path.join(dir_path, profile_name))
+        except OSError:
+            return False
+        return entry[:2] == (stat.st_size, stat.st_mtime_ns)
+
+    # Checks if profile still has the given contents according to manifest, without reading it
+    def is_unchanged(self, dir_path, profile_name, digest):
+        entry = self.entries.get(profile_name)
+        return bool(entry) and entry[2] == digest and self.is_current(dir_path, profile_name)
+
+    # Updates manifest for the given profiles and drops removed ones, returns profiles whose contents changed
+    def update(self, dir_path, profile_names, removed=(), profile_stats=None):
+        for profile_name in removed:
+            self.drop_entry(profile_name)
+        changed = []
+        for profile_name in profile_names:
+            entry = self.entries.get(profile_name)
+            digest = self.get_digest(dir_path, profile_name, profile_stats and profile_stats.get(profile_name))
+            if entry and entry[2] != digest:
+                changed.append(profile_name)
+        return changed
+
+    # Returns lists of profile names with identical contents among the given digests
+    def group_by_digest(self, digests):
+        groups = (self.names_by_digest.get(digest) for digest in digests)
+        return [list(names) for names in groups if names and len(names) > 1]
+
+    # Returns lists of profile names with identical contents, checked against the files
+    # With touched_only, only digests touched since clear_touched are grouped
+    def get_duplicate_groups(self, dir_path, touched_only=False):
+        digests = self.touched_digests if touched_only else self.names_by_digest
+        # Profiles may have been written after they were hashed, hash the candidates again if so
+        for profile_name in itertools.chain.from_iterable(self.group_by_digest(list(digests))):
+            self.get_digest(dir_path, profile_name)
+        return self.group_by_digest(list(self.touched_digests if touched_only else self.names_by_digest))
+
+    # Starts tracking touched digests and profiles anew, once duplicates were determined
+    def clear_touched(self):
+        self.touched_digests = set()
+        self.touched_names = set()
+
+    # Returns manifest contents as plain data, for the catalog cache
+    def get_state(self):
+        return list(self.entries.items())
+
+    # Creates manifest from data returned by get_state
+    @classmethod
+    def from_state(cls, state):
+        manifest = cls()
+        for profile_name, entry in state:
+            manifest.set_entry(profile_name, entry)
+        manifest.clear_touched()
+        return manifest
+
+
+class StatusProvider:
+    def __init__(self, openvpn_path, proc_root="/proc", ttl=1.0, stats=None):
+        self.openvpn_path = openvpn_path
+        self.stats = stats
+        self.proc_root = proc_root
+        self.ttl = ttl # seconds a status probe result is reused for
+        self.cached_status = None # (probe time, connected profile name)
+
+    # Returns (pid, ovpn profile path) of running openvpn processes started with --config
+    def find_processes(self):
+        processes = []
+        if not self.openvpn_path:
+            return processes
+
+        openvpn_path = os.fsencode(self.openvpn_path)
+        try:
+            entries = os.listdir(self.proc_root)
+        except OSError:
+            return processes
+
+        for pid in entries:
+            if not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self.proc_root, pid, "cmdline"), "rb") as cmdline_file:
+                    args = cmdline_file.read().split(b"\0")
+            except OSError:
+                continue # process exited while scanning
+            for i in range(len(args) - 2):
+                if args[i] == openvpn_path and args[i + 1] == b"--config":
+                    processes.append((int(pid), os.fsdecode(args[i + 2])))
+                    break
+
+        return processes
+
+    # Returns profile name of the running openvpn connection, None if not connected
+    def get_connected_profile(self):
+        now = time.monotonic()
+        cached_status = self.cached_status
+        if cached_status and now - cached_status[0] < self.ttl:
+            if self.stats:
+                self.stats.count("status_cache", "hit")
+            return cached_status[1]
+
+        if self.stats:
+            self.stats.count("status_cache", "miss")
+
+        processes = self.find_processes()
+        profile = os.path.basename(processes[0][1]) if processes else None
+        self.cached_status = (now, profile)
+        return profile
+
+    # Forces next status request to probe running processes again
+    def invalidate(self):
+        self.cached_status = None
+
+
+class TunnelSampler:
+    def __init__(self, rtt_probe, net_dev_path="/proc/net/dev", interface_prefix="tun",
+                 interval=2.0, capacity=30, rtt_interval=5, idle_timeout=60):
+        self.rtt_probe = rtt_probe # callable measuring rtt in seconds to remote of a profile, None if unreachable
+        self.net_dev_path = net_dev_path
+        self.interface_prefix = interface_prefix # interfaces whose counters are summed
+        self.interval = interval # seconds between counter samples
+        self.rtt_interval = rtt_interval # counter samples per rtt probe
+        self.idle_timeout = idle_timeout # seconds sampling continues after summary was last requested
+        self.lock = threading.Lock()
+        self.counters = collections.deque(maxlen=capacity) # (time, received bytes, sent bytes)
+        self.rtts = collections.deque(maxlen=capacity) # rtt in seconds, None if probe failed
+        self.profile_name = None # profile of the sampled connection
+        self.sample_count = 0
+        self.last_access = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # Returns (received, sent) byte counters of tunnel interfaces, None if there is no tunnel
+    def read_counters(self):
+        try:
+            with open(self.net_dev_path, "r") as net_dev:
+                lines = net_dev.readlines()[2:]
+        except OSError:
+            return None
+        counters = None
+        for line in lines:
+            interface, _, fields = line.partition(":")
+            fields = fields.split()
+            if not interface.strip().startswith(self.interface_prefix) or len(fields) < 9:
+                continue
+            # 8 receive columns followed by 8 transmit columns, both starting with bytes
+            received, sent = counters or (0, 0)
+            counters = (received + int(fields[0]), sent + int(fields[8]))
+        return counters
+
+    # Takes one counter sample, and an rtt sample every rtt_interval counter samples
+    def sample(self):
+        counters = self.read_counters()
+        now = time.monotonic()
+        with self.lock:
+            profile_name = self.profile_name
+            if counters is None:
+                self.counters.clear()
+            else:
+                # Counters restart when the tunnel is recreated
+                if self.counters and (counters[0] < self.counters[-1][1] or counters[1] < self.counters[-1][2]):
+                    self.counters.clear()
+                self.counters.append((now, counters[0], counters[1]))
+            probe_rtt = profile_name and self.sample_count % self.rtt_interval == 0
+            self.sample_count += 1
+        if probe_rtt:
+            rtt = self.rtt_probe(profile_name)
+            with self.lock:
+                if self.profile_name == profile_name:
+                    self.rtts.append(rtt)
+
+    def run(self, stop_event):
+        while time.monotonic() - self.last_access < self.idle_timeout:
+            self.sample()
+            if stop_event.wait(self.interval):
+                break
+
+    # Samples the connection of profile in background until summary is no longer requested
+    def start(self, profile_name):
+        self.last_access = time.monotonic()
+        with self.lock:
+            if profile_name != self.profile_name:
+                self.counters.clear()
+                self.rtts.clear()
+                self.profile_name = profile_name
+                self.sample_count = 0
+            if self.thread and self.thread.is_alive() and not self.stop_event.is_set():
+                return
+            # A stopped thread may still be finishing its last sample, the new one gets its own stop event
+            self.stop_event = threading.Event()
+            self.thread = threading.Thread(target=self.run, args=(self.stop_event,), name="SurfTunnelSampler", daemon=True)
+            self.thread.start()
+
+    # Stops sampling and forgets samples of the last connection
+    def stop(self):
+        self.stop_event.set()
+        with self.lock:
+            self.profile_name = None
+            self.counters.clear()
+            self.rtts.clear()
+
+    # Returns current and average transfer rates in bytes/s and rtt in seconds, None where not sampled yet
+    def get_summary(self):
+        self.last_access = time.monotonic()
+        with self.lock:
+            counters = list(self.counters)
+            rtts = [rtt for rtt in self.rtts if rtt is not None]
+        summary = {"rx_rate": None, "tx_rate": None, "avg_rx_rate": None, "avg_tx_rate": None, "rtt": None, "avg_rtt": None}
+        if len(counters) >= 2:
+            (previous_time, previous_rx, previous_tx), (last_time, last_rx, last_tx) = counters[-2:]
+            first_time, first_rx, first_tx = counters[0]
+            summary["rx_rate"] = (last_rx - previous_rx) / (last_time - previous_time)
+            summary["tx_rate"] = (last_tx - previous_tx) / (last_time - previous_time)
+            summary["avg_rx_rate"] = (last_rx - first_rx) / (last_time - first_time)
+            summary["avg_tx_rate"] = (last_tx - first_tx) / (last_time - first_time)
+        if rtts:
+            summary["rtt"] = rtts[-1]
+            summary["avg_rtt"] = sum(rtts) / len(rtts)
+        return summary
+
+
+class ManagementClient:
+    # Pseudo state reported when openvpn rejects the service credentials
+    AUTH_FAILED = "AUTH_FAILED"
+
+    def __init__(self, socket_path, timeout=5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout # seconds to wait for command replies
+        self.socket = None
+        self.buffer = b""
+        self.notifications = collections.deque() # real-time (">...") messages received while waiting for replies
+        self.closed = False
+
+    # Connects to openvpn management socket, raises OSError if openvpn is not listening
+    def connect(self):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(self.socket_path)
+        except OSError:
+            self.close()
+            raise
+
+    # Connects as soon as openvpn opens the management socket, returns False if it does not within timeout
+    def connect_when_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.connect()
+                return True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.05)
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    # Returns next line sent by openvpn, None on timeout or when connection is closed
+    def read_line(self, deadline):
+        while b"\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if self.closed or remaining <= 0:
+                return None
+            self.socket.settimeout(remaining)
+            try:
+                data = self.socket.recv(4096)
+            except socket.timeout:
+                return None
+            except OSError:
+                data = b""
+            if not data:
+                self.closed = True
+                return None
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return line.decode("utf-8", "replace").rstrip("\r")
+
+    # Sends command and returns reply lines, real-time messages are queued as notifications
+    def send_command(self, command):
+        self.socket.sendall(command.encode() + b"\n")
+        deadline = time.monotonic() + self.timeout
+        reply = []
+        while True:
+            line = self.read_line(deadline)
+            if line is None:
+                raise OSError(f"No reply from openvpn to '{command}'")
+            if line.startswith(">"):
+                self.notifications.append(line)
+            elif not reply and line.startswith(("SUCCESS:", "ERROR:")):
+                return [line]
+            elif line == "END":
+                return reply
+            else:
+                reply.append(line)
+
+    # Returns state name from a state line or notification, e.g. ">STATE:1700000000,CONNECTED,SUCCESS,..."
+    @staticmethod
+    def parse_state(line):
+        # Only notifications have a prefix, reply lines may contain ":" in IPv6 addresses
+        if line.startswith(">STATE:"):
+            line = line[len(">STATE:"):]
+        fields = line.split(",")
+        return fields[1] if len(fields) > 1 else None
+
+    # Returns current openvpn state and enables real-time state notifications
+    def watch_state(self):
+        self.send_command("state on")
+        states = [self.parse_state(line) for line in self.send_command("state")]
+        return states[-1] if states else None
+
+    # Waits for one of the states, returns it, None on timeout or EXITING if openvpn went away
+    def wait_for_state(self, states, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            line = self.notifications.popleft() if self.notifications else self.read_line(deadline)
+            if line is None:
+                return "EXITING" if self.closed else None
+            if line.startswith(">STATE:"):
+                state = self.parse_state(line)
+                if state in states:
+                    return state
+            elif line.startswith(">PASSWORD:Verification Failed"):
+                return self.AUTH_FAILED
+
+    # Sends signal (e.g. SIGTERM) to openvpn, returns True if openvpn accepted it
+    def send_signal(self, signal_name):
+        return self.send_command(f"signal {signal_name}")[0].startswith("SUCCESS:")
+
+
+class LatencyDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, reply):
+        self.reply = reply # future resolved with the arrival time of the first datagram
+
+    def datagram_received(self, data, addr):
+        if not self.reply.done():
+            self.reply.set_result(time.monotonic())
+
+    def error_received(self, exc):
+        if not self.reply.done():
+            self.reply.set_exception(exc)
+
+
+class LatencyProber:
+    # OpenVPN P_CONTROL_HARD_RESET_CLIENT_V2 header: opcode/key id, session id, empty ack array, packet id
+    udp_reset_opcode = b"\x38"
+
+    def __init__(self, concurrency=32, timeout=1.0, ttl=600):
+        self.concurrency = concurrency # max probes in flight
+        self.timeout = timeout # seconds per probe, including name resolution
+        self.ttl = ttl # seconds a measurement stays valid
+        self.latencies = {} # host -> (probe time, rtt in seconds or None if unreachable)
+        self.generation = 0 # changes whenever new measurements are stored
+
+    # Returns (ip, port) of host, resolving names off the event loop
+    async def resolve(self, host, port, socket_type):
+        try:
+            return (str(ipaddress.ip_address(host)), port)
+        except ValueError:
+            loop = asyncio.get_event_loop()
+            return (await loop.getaddrinfo(host, port, type=socket_type))[0][4]
+
+    # Returns time taken by TCP handshake with host
+    async def probe_tcp(self, host, port):
+        address = await self.resolve(host, port, socket.SOCK_STREAM)
+        start = time.monotonic()
+        _, writer = await asyncio.open_connection(address[0], address[1])
+        rtt = time.monotonic() - start
+        writer.close()
+        return rtt
+
+    # Returns time taken by openvpn server to answer a session reset packet
+    async def probe_udp(self, host, port):
+        loop = asyncio.get_event_loop()
+        address = await self.resolve(host, port, socket.SOCK_DGRAM)
+        reply = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: LatencyDatagramProtocol(reply), remote_addr=(address[0], address[1])
+        )
+        try:
+            start = time.monotonic()
+            transport.sendto(self.udp_reset_opcode + os.urandom(8) + b"\x00" + b"\x00\x00\x00\x00")
+            return (await reply) - start
+        finally:
+            transport.close()
+
+    # Probes a single (host, port, proto) target, returns None if unreachable
+    async def probe_target(self, target, semaphore):
+        host, port, proto = target
+        probe = self.probe_udp if proto == "udp" else self.probe_tcp
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(probe(host, port), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                return None
+
+    async def probe_targets(self, targets):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self.probe_target(target, semaphore) for target in targets])
+
+    # Probes (host, port, proto) targets concurrently and stores results in latency table
+    def probe(self, targets):
+        targets = list(targets)
+        if not targets:
+            return {}
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(self.probe_targets(targets))
+        finally:
+            loop.close()
+
+        now = time.monotonic()
+        for (host, _, _), rtt in zip(targets, results):
+            self.latencies[host] = (now, rtt)
+        self.generation += 1
+        return {target[0]: rtt for target, rtt in zip(targets, results)}
+
+    # Checks if host has no latency measurement within ttl
+    def is_stale(self, host):
+        measurement = self.latencies.get(host)
+        return not measurement or time.monotonic() - measurement[0] >= self.ttl
+
+    # Returns measured rtt of host in seconds, None if unknown or unreachable
+    def get_latency(self, host):
+        measurement = self.latencies.get(host)
+        return measurement[1] if measurement else None
+
+
+class DirectoryWatcher:
+    # inotify event flags
+    IN_CLOSE_WRITE = 0x8
+    IN_DELETE = 0x200
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    event_header = struct.Struct("iIII") # wd, mask, cookie, name length
+
+    def __init__(self, path, callback, suffix=".ovpn", poll_interval=2.0, settle_delay=0.2):
+        self.path = path
+        self.callback = callback # called with (added, removed[, changed]) file names from the watcher thread
+        self.suffix = suffix
+        self.poll_interval = poll_interval # seconds between mtime checks when inotify is not available
+        self.settle_delay = settle_delay # seconds to collect more events before reporting a change
+        self.names = set() # file names currently in folder, as far as the watcher knows
+        self.stopped = threading.Event()
+        self.thread = None
+        self.libc = None
+        self.inotify_fd = None
+        self.watch_descriptor = None
+
+    # Starts watching folder on a background thread
+    def start(self):
+        self.names = self.list_names()
+        self.libc = self.load_inotify()
+        target = self.watch_inotify if self.libc else self.watch_polling
+        self.thread = threading.Thread(target=target, name="SurfProfileWatcher", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    # Returns libc with inotify support, None if not available on this system
+    def load_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return None
+        if inotify_fd < 0:
+            return None
+        self.inotify_fd = inotify_fd
+        return libc
+
+    # Returns names of the watched files in folder
+    def list_names(self):
+        try:
+            return {f for f in os.listdir(self.path) if f.endswith(self.suffix)}
+        except OSError:
+            return set()
+
+    # Reports difference between the last known and current folder contents
+    def resync(self):
+        names = self.list_names()
+        added, removed = names - self.names, self.names - names
+        self.names = names
+        if added or removed:
+            self.callback(sorted(added), removed)
+
+    # Watches folder again, needed after folder was replaced by a profile refresh
+    def add_watch(self):
+        if self.watch_descriptor is not None:
+            self.libc.inotify_rm_watch(self.inotify_fd, self.watch_descriptor)
+            self.watch_descriptor = None
+        mask = (self.IN_CLOSE_WRITE | self.IN_DELETE | self.IN_MOVED_FROM | self.IN_MOVED_TO
+                | self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_ONLYDIR)
+        watch_descriptor = self.libc.inotify_add_watch(self.inotify_fd, os.fsencode(self.path), mask)
+        if watch_descriptor >= 0:
+            self.watch_descriptor = watch_descriptor
+        return watch_descriptor >= 0
+
+    # Returns inotify events read so far as (wd, mask, name) tuples
+    def read_events(self):
+        events = []
+        try:
+            buffer = os.read(self.inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset < len(buffer):
+            watch_descriptor, mask, _, length = self.event_header.unpack_from(buffer, offset)
+            offset += self.event_header.size
+            name = os.fsdecode(buffer[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((watch_descriptor, mask, name))
+        return events
+
+    def watch_inotify(self):
+        try:
+            while not self.stopped.is_set():
+                if self.watch_descriptor is None:
+                    # Folder missing or being swapped, retry shortly
+                    if not self.add_watch():
+                        self.stopped.wait(self.settle_delay)
+                        continue
+                    self.resync()
+
+                if not select.select([self.inotify_fd], [], [], 1.0)[0]:
+                    continue
+                # Let bursts (e.g. copying many profiles) settle into a single update
+                self.stopped.wait(self.settle_delay)
+
+                added, removed = set(), set()
+                overflow = False
+                for watch_descriptor, mask, name in self.read_events():
+                    if mask & self.IN_Q_OVERFLOW:
+                        overflow = True
+                        continue
+                    # Ignore events of folder instances that were moved away
+                    if watch_descriptor != self.watch_descriptor:
+                        continue
+                    if mask & (self.IN_MOVE_SELF | self.IN_DELETE_SELF | self.IN_IGNORED):
+                        self.watch_descriptor = None
+                        break
+                    if not name.endswith(self.suffix):
+                        continue
+                    # Files are reported once written, not when they are created empty
+                    if mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                        added.add(name)
+                        removed.discard(name)
+                    elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                        removed.add(name)
+                        added.discard(name)
+
+                if self.watch_descriptor is None:
+                    # Folder was replaced, watch it again and report the difference
+                    continue
+                if overflow:
+                    # Events were dropped by the kernel, compare folder contents instead
+                    self.resync()
+                    continue
+                # Known files written again or replaced have new contents
+                changed = added & self.names
+                added -= self.names
+                removed &= self.names
+                self.names = (self.names | added) - removed
+                if added or removed or changed:
+                    self.callback(sorted(added), removed, sorted(changed))
+        finally:
+            os.close(self.inotify_fd)
+
+    def watch_polling(self):
+        last_state = None
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                stat = os.stat(self.path)
+                state = (stat.st_ino, stat.st_mtime_ns)
+            except OSError:
+                continue
+            if state != last_state:
+                last_state = state
+                self.resync()
+
+
+class CredentialStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.watcher = None
+        # Read once, afterwards the file is only written from memory and watched for deletion
+        self.username, self.password, self.file_exists = self.read()
+
+    # Returns (username, password, file exists) from credentials file
+    def read(self):
+        try:
+            with open(self.path, "r") as credentials_file:
+                lines = credentials_file.read().split("\n")
+        except OSError:
+            return None, None, False
+        return (lines[0] or None), ((lines[1] or None) if len(lines) > 1 else None), True
+
+    # Updates username and/or password, keeping the other one, and writes credentials file
+    def update(self, username=None, password=None):
+        with self.lock:
+            self.username = username or self.username
+            self.password = password or self.password
+            self.write_locked()
+
+    # Replaces credentials file in a single rename, file is never readable by others or partially written
+    def write_locked(self):
+        # mkstemp creates the file with mode 0600
+        temp_fd, temp_path = tempfile.mkstemp(prefix=".credentials.", dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(temp_fd, "w") as credentials_file:
+                credentials_file.write(f"{self.username or ''}\n{self.password or ''}\n")
+            os.replace(temp_path, self.path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.file_exists = True
+
+    # Keeps file_exists in sync with deletions (e.g. extension updates) without checking the file per query
+    def start_watching(self):
+        if self.watcher:
+            return
+        self.watcher = DirectoryWatcher(os.path.dirname(self.path), self.on_files_changed, suffix=os.path.basename(self.path))
+        self.watcher.start()
+
+    def on_files_changed(self, added, removed, changed=()):
+        name = os.path.basename(self.path)
+        if name in removed:
+            self.file_exists = False
+        elif name in added or name in changed:
+            with self.lock:
+                username, password, file_exists = self.read()
+                # Ignore own writes, pick up files put in place by someone else
+                if file_exists and (username, password) != (self.username, self.password):
+                    self.username, self.password = username, password
+                self.file_exists = file_exists
+
 
 class Surf:
+    # Bump whenever the layout of the catalog cache or server objects changes
+    catalog_version = 5
+    connect_timeout = 30 # seconds openvpn may take to reach CONNECTED state
+    management_timeout = 5 # seconds to wait for openvpn management socket and replies
+    failover_candidates = 5 # servers tried by a failover connect
+    failover_budget = 90 # seconds a failover connect may take over all its attempts
+    backoff_delay = 30 # seconds a server is skipped by failover after its first failed connect, doubled per failure
+    max_backoff_delay = 1800
+    pkexec_denied_codes = (126, 127) # pkexec exit codes when the password prompt was dismissed or not authorized
+    # Pseudo state reported when openvpn could not be started with admin privileges
+    NOT_AUTHORIZED = "NOT_AUTHORIZED"
+    # Pseudo state reported when a connect was cancelled by a disconnect
+    CANCELLED = "CANCELLED"
+    cancel_poll_interval = 0.2 # seconds between checks for cancellation while waiting for openvpn to connect
+    catalog_save_delay = 5 # seconds profile changes are collected before the catalog cache is written again
+    configurations_url = "https://my.surfshark.com/vpn/api/v1/server/configurations"
     openvpn_bin_paths = ["/usr/bin/openvpn", "/bin/openvpn", "/usr/sbin/openvpn"]
     # Some additional multihop server profiles that do not follow naming trend
     special_server_profiles = [
@@ -87,11 +1475,18 @@ class Surf:
         "45.83.91.133_tcp.ovpn",
         "45.83.91.133_udp.ovpn"
     ]
-    country_mapping = []
+    # Connection types (as returned by get_conn_type_from_profile_name) served by each server list
+    server_groups = {
+        "reg": ["UDP", "TCP"],
+        "st": ["Static-IP UDP", "Static-IP TCP"],
+        "mp": ["Multi-Point UDP", "Multi-Point TCP"],
+    }
+    country_mapping = {} # server code -> server details
     all_servers = [] # store profile name for all available servers
     reg_servers = [] # stores details of all regular VPN servers
     st_servers = [] # stores details of all static ip server profiles
     mp_servers = [] # stores details of all multi-point/multi-hop servers
+    search_index = {} # connection type -> ServerIndex over the server lists
     
     # Returns the openvpn bin path
     def get_installed_path(self):
@@ -124,10 +1519,7 @@ class Surf:
             server_code = profile_name.split("_")[0]
         
         if server_code:
-            try:
-                detail_object = next(d for d in self.country_mapping if d["code"] == server_code)
-            except StopIteration:
-                None # Server mapping not found
+            detail_object = self.country_mapping.get(server_code)
 
         if not detail_object:
             return {
@@ -158,14 +1550,14 @@ class Surf:
         if not server_details or not profile_name:
             return None
         
-        return {
-            "country": server_details["country"],
-            "city": server_details["city"] + self.get_speacial_server_number(profile_name),
-            "alt_word": server_details["altSearch"],
-            "flag_file": self.flag_name(server_details["country"]),
-            "conn_type": self.get_conn_type_from_profile_name(profile_name),
-            "server_profile": profile_name
-        }
+        return ServerRecord(
+            server_details["country"],
+            server_details["city"] + self.get_speacial_server_number(profile_name),
+            server_details["altSearch"],
+            self.flag_name(server_details["country"]),
+            ConnectionType.from_label(self.get_conn_type_from_profile_name(profile_name)),
+            profile_name,
+        )
 
     # Populate list of server objects with details
     def populate_server_object_list(self, profile_list):
@@ -177,14 +1569,130 @@ class Surf:
 
         return server_list
     
+    # Returns the modification time of server_profile folder, None if missing
+    def get_profiles_mtime(self):
+        try:
+            return os.stat(self.surfshark_dir_path).st_mtime_ns
+        except OSError:
+            return None
+
+    # Loads server lists and search index from catalog cache, returns False if cache is missing or stale
+    def load_catalog(self):
+        try:
+            with open(self.catalog_file_path, "rb") as catalog_file:
+                catalog = pickle.load(catalog_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError):
+            return False
+
+        # Profile metadata and manifest validate themselves per file, so they are reused even if server lists are stale
+        try:
+            if catalog["version"] == self.catalog_version:
+                self.profile_metadata = ProfileMetadataIndex.from_state(catalog["profile_metadata"])
+                self.profile_manifest = ProfileManifest.from_state(catalog["profile_manifest"])
+        except (TypeError, KeyError, ValueError):
+            None # metadata is scanned again from profiles
+
+        try:
+            catalog_valid = (catalog["version"] == self.catalog_version
+                             and catalog["mapping_hash"] == self.mapping_hash
+                             and catalog["profiles_mtime"] == self.get_profiles_mtime()
+                             # Rewriting a profile does not change folder mtime, hidden duplicates may be stale
+                             and all(
+                                 self.profile_manifest.is_current(self.surfshark_dir_path, profile_name)
+                                 for item in catalog["duplicate_profiles"].items() for profile_name in item
+                             ))
+        except (TypeError, KeyError):
+            catalog_valid = False
+        if not catalog_valid:
+            return False
+
+        self.country_mapping = catalog["country_mapping"]
+        self.all_servers = catalog["all_servers"]
+        self.duplicate_profiles = catalog["duplicate_profiles"]
+        self.search_index = {
+            conn_type: ServerIndex.from_state(state) for conn_type, state in catalog["search_index"].items()
+        }
+        # Server lists share records with the index, both are kept in sequence order
+        server_lists = {
+            group: [server for _, server in heapq.merge(
+                *[self.search_index[conn_type].records.items() for conn_type in conn_types], key=lambda r: r[0]
+            )]
+            for group, conn_types in self.server_groups.items()
+        }
+        self.reg_servers = server_lists["reg"]
+        self.st_servers = server_lists["st"]
+        self.mp_servers = server_lists["mp"]
+        self.next_seq = catalog["next_seq"]
+        self.catalog_profiles_mtime = catalog["profiles_mtime"]
+        self.catalog_generation += 1
+        return True
+
+    # Writes server lists and search index to catalog cache
+    def save_catalog(self, profiles_mtime):
+        catalog = {
+            "version": self.catalog_version,
+            "mapping_hash": self.mapping_hash,
+            "profiles_mtime": profiles_mtime,
+            "country_mapping": self.country_mapping,
+            "all_servers": self.all_servers,
+            "search_index": {conn_type: index.get_state() for conn_type, index in self.search_index.items()},
+            "next_seq": self.next_seq,
+            "profile_metadata": self.profile_metadata.get_state(),
+            "profile_manifest": self.profile_manifest.get_state(),
+            "duplicate_profiles": self.duplicate_profiles,
+        }
+        self.catalog_profiles_mtime = profiles_mtime
+        if self.catalog_save_timer:
+            self.catalog_save_timer.cancel()
+            self.catalog_save_timer = None
+        temp_path = f"{self.catalog_file_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as catalog_file:
+                pickle.dump(catalog, catalog_file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.catalog_file_path)
+        except OSError:
+            # Cache is only an optimization, extension works without it
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    # Writes catalog cache once catalog_save_delay has passed, changes made until then are written along
+    def schedule_catalog_save(self, profiles_mtime):
+        with self.catalog_lock:
+            self.catalog_profiles_mtime = profiles_mtime
+            if self.catalog_save_timer:
+                return
+            self.catalog_save_timer = threading.Timer(self.catalog_save_delay, self.save_pending_catalog)
+            self.catalog_save_timer.daemon = True
+            self.catalog_save_timer.start()
+
+    # Writes catalog cache now if a write is scheduled
+    def save_pending_catalog(self):
+        with self.catalog_lock:
+            if self.catalog_save_timer:
+                self.save_catalog(self.catalog_profiles_mtime)
+
     # Reload ovpn server profile details to memory 
     def refresh_server_list(self):
-        self.all_servers = [f for f in os.listdir(self.surfshark_dir_path) if os.path.isfile(os.path.join(self.surfshark_dir_path, f))]
+        with self.catalog_lock:
+            self.rebuild_server_list()
+
+    def rebuild_server_list(self):
+        # Take the mtime before listing, so changes made during the scan invalidate the cache
+        profiles_mtime = self.get_profiles_mtime()
+        with os.scandir(self.surfshark_dir_path) as entries:
+            profile_stats = {entry.name: entry.stat() for entry in entries if entry.is_file()}
+        self.all_servers = list(profile_stats)
+        # Only profiles added or changed since the manifest was written are hashed
+        self.profile_manifest.update(
+            self.surfshark_dir_path, self.all_servers, set(self.profile_manifest.entries) - set(profile_stats), profile_stats
+        )
+        self.duplicate_profiles = self.get_duplicate_profiles()
+        listed_servers = [s for s in self.all_servers if s not in self.duplicate_profiles]
         
         # load regular servers list
         temp_list = list(
             filter(
-                lambda s: 'st0' not in s and 'mp0' not in s, self.all_servers
+                lambda s: 'st0' not in s and 'mp0' not in s, listed_servers
             )
         )
         # Remove special mp server profiles
@@ -195,49 +1703,636 @@ class Surf:
         self.reg_servers = self.populate_server_object_list(temp_list)
         temp_list.clear()
 
-        # load static ip servers list
-        temp_list = list(
-            filter(
-                lambda s: 'st0' in s, self.all_servers
+        # load static ip servers list
+        temp_list = list(
+            filter(
+                lambda s: 'st0' in s, listed_servers
+            )
+        )
+
+        self.st_servers = self.populate_server_object_list(temp_list)
+        temp_list.clear()
+
+        # load multipoint servers list
+        temp_list = list(
+            filter(
+                lambda s: 'mp0' in s, listed_servers
+            )
+        )
+        # Add special mp server profiles
+        temp_list.extend(self.special_server_profiles)
+        self.mp_servers = self.populate_server_object_list(temp_list)
+
+        self.build_search_index()
+        self.catalog_generation += 1
+        self.save_catalog(profiles_mtime)
+
+    # Builds per connection type prefix index over the server lists
+    def build_search_index(self):
+        numbered_servers = {conn_type: [] for group in self.server_groups.values() for conn_type in group}
+        seq = itertools.count()
+        for server_list in (self.reg_servers, self.st_servers, self.mp_servers):
+            for server in server_list:
+                numbered_servers[server.conn_type.value].append((next(seq), server))
+
+        search_index = {}
+        for conn_type, servers in numbered_servers.items():
+            search_index[conn_type] = ServerIndex()
+            search_index[conn_type].extend(servers)
+
+        self.search_index = search_index
+        self.next_seq = next(seq)
+
+    # Loads server lists from catalog cache or profiles, unless already loaded
+    def load_server_list(self):
+        if self.catalog_ready.is_set():
+            return
+        with self.catalog_lock:
+            if self.catalog_ready.is_set():
+                return
+            # Full rebuild only when profiles or server-country mapping changed since last run
+            with self.stats.timed("load_server_list"):
+                if self.load_catalog():
+                    self.stats.count("catalog_cache", "hit")
+                else:
+                    self.stats.count("catalog_cache", "miss")
+                    self.refresh_server_list()
+            self.catalog_ready.set()
+
+    # Checks if server lists are loaded and can be searched without waiting
+    def is_ready(self):
+        return self.catalog_ready.is_set()
+
+    # Loads server lists on a background thread, then keeps them updated with folder changes
+    def warm_up(self):
+        if self.warm_up_thread:
+            return
+
+        def warm_up_catalog():
+            self.load_server_list()
+            self.start_watching()
+
+        self.warm_up_thread = threading.Thread(target=warm_up_catalog, name="SurfWarmUp", daemon=True)
+        self.warm_up_thread.start()
+
+    # Applies profiles created or deleted in server_profile folder to the catalog as they happen
+    def start_watching(self):
+        if self.profiles_watcher:
+            return
+        self.profiles_watcher = DirectoryWatcher(self.surfshark_dir_path, self.update_server_list)
+        self.profiles_watcher.start()
+
+    # Returns server list group and protocol of a connection type action, e.g. st_udp -> (st, udp)
+    @staticmethod
+    def get_group_and_protocol(server_type):
+        # multihop connections
+        if server_type.startswith('mp'):
+            return "mp", server_type.replace('mp_', '')
+        # static ip connections
+        if server_type.startswith('st'):
+            return "st", server_type.replace('st_', '')
+        return "reg", server_type
+
+    # Returns name of the server list ("reg", "st" or "mp") a profile belongs to
+    def get_server_group(self, profile_name):
+        if 'mp0' in profile_name or profile_name in self.special_server_profiles:
+            return "mp"
+        if 'st0' in profile_name:
+            return "st"
+        return "reg"
+
+    # Returns profiles with the same contents as another profile of the same connection type -> that profile
+    def get_duplicate_profiles(self):
+        groups = self.profile_manifest.get_duplicate_groups(self.surfshark_dir_path)
+        self.profile_manifest.clear_touched()
+        return self.get_kept_profiles(groups)
+
+    # Returns duplicate profiles updated for the profiles touched since they were determined, other groups are kept
+    def update_duplicate_profiles(self):
+        groups = self.profile_manifest.get_duplicate_groups(self.surfshark_dir_path, touched_only=True)
+        # Touched profiles and the ones grouped with them are decided again, including the profile kept for them
+        touched = self.profile_manifest.touched_names.union(*groups)
+        self.profile_manifest.clear_touched()
+        duplicates = {p: kept for p, kept in self.duplicate_profiles.items() if p not in touched and kept not in touched}
+        duplicates.update(self.get_kept_profiles(groups))
+        return duplicates
+
+    # Returns each profile of groups with identical contents -> profile of the same connection type listed instead
+    def get_kept_profiles(self, groups):
+        duplicates = {}
+        for profile_names in groups:
+            names_by_type = collections.defaultdict(list)
+            for profile_name in profile_names:
+                # Special mp server profiles are always listed
+                if profile_name not in self.special_server_profiles:
+                    names_by_type[self.get_conn_type_from_profile_name(profile_name)].append(profile_name)
+            for same_profiles in names_by_type.values():
+                # Hostname profiles map to server details, IP-named ones usually do not
+                kept_profile = min(same_profiles, key=lambda p: (p[:1].isdigit(), p))
+                duplicates.update((p, kept_profile) for p in same_profiles if p != kept_profile)
+        return duplicates
+
+    # Applies added, removed and changed profile names to server lists and search index without rescanning
+    def update_server_list(self, added, removed, changed=()):
+        self.load_server_list()
+        with self.catalog_lock:
+            profiles_mtime = self.get_profiles_mtime()
+            known_profiles = set(self.all_servers)
+            # Special mp server profiles are always listed, regardless of files present
+            added = [p for p in dict.fromkeys(added) if p not in known_profiles and p not in self.special_server_profiles]
+            removed = {p for p in removed if p in known_profiles and p not in self.special_server_profiles}
+            changed = [p for p in dict.fromkeys(changed) if p in known_profiles and p not in removed]
+            if not added and not removed and not changed:
+                return
+
+            # Profiles start or stop being duplicates only when some profile is added, removed or changed
+            self.profile_manifest.update(self.surfshark_dir_path, added + changed, removed)
+            previous_duplicates = self.duplicate_profiles
+            self.duplicate_profiles = self.update_duplicate_profiles()
+            hidden = removed | {p for p in self.duplicate_profiles if p not in previous_duplicates}
+            shown = [
+                p for p in added + sorted(p for p in previous_duplicates if p not in self.duplicate_profiles)
+                if p not in self.duplicate_profiles and p not in removed
+            ]
+
+            # Lists may be iterated by queries outside the lock, only lists that change are copied
+            server_lists = {"reg": self.reg_servers, "st": self.st_servers, "mp": self.mp_servers}
+            hidden_groups = {self.get_server_group(p) for p in hidden}
+            for group in hidden_groups:
+                server_lists[group] = [s for s in server_lists[group] if s.server_profile not in hidden]
+            for profile in hidden:
+                self.search_index[self.get_conn_type_from_profile_name(profile)].remove(profile)
+
+            shown_servers = collections.defaultdict(list)
+            for profile in shown:
+                server = self.populate_server_object(self.get_server_details(profile), profile)
+                shown_servers[self.get_server_group(profile)].append(server)
+                self.search_index[server.conn_type.value].add(server, self.next_seq)
+                self.next_seq += 1
+            for group, servers in shown_servers.items():
+                if group in hidden_groups:
+                    server_lists[group].extend(servers) # already copied above
+                else:
+                    server_lists[group] = server_lists[group] + servers
+
+            self.all_servers = [p for p in self.all_servers if p not in removed] + added if removed else self.all_servers + added
+            self.reg_servers = server_lists["reg"]
+            self.st_servers = server_lists["st"]
+            self.mp_servers = server_lists["mp"]
+            self.catalog_generation += 1
+            # Watcher batches arrive one after another while profiles are copied, cache is written once they settle
+            self.schedule_catalog_save(profiles_mtime)
+
+    # Splits lowercased query into search text and (key, value) filters on profile contents, e.g. port:443
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def parse_query(query):
+        filters = []
+        words = []
+        for word in query.split(" "):
+            key, separator, value = word.partition(":")
+            if separator and key in ProfileMetadata.filter_keys:
+                filters.append((key, value))
+            else:
+                words.append(word)
+        return " ".join(words), tuple(filters)
+
+    # Checks if query has text besides filters, only such queries are matched by similarity in fuzzy mode
+    @staticmethod
+    def has_search_text(query):
+        return bool(Surf.parse_query(query.lower() if query else "")[0].strip())
+
+    # Checks if every server matching query also matches the shorter query it extends, e.g. "port:44" -> "port:443"
+    @staticmethod
+    def is_narrowing_query(query, prefix):
+        text, filters = Surf.parse_query(query)
+        prefix_text, prefix_filters = Surf.parse_query(prefix)
+        # Text of a filter still being typed (e.g. "p" of "port:443") is not part of the longer query
+        return text.startswith(prefix_text) and all(
+            any(key == prefix_key and value.startswith(prefix_value) for key, value in filters)
+            for prefix_key, prefix_value in prefix_filters
+        )
+
+    # Checks if profile contents match all query filters
+    def matches_filters(self, server, filters):
+        metadata = self.profile_metadata.get(server.server_profile)
+        return bool(metadata) and metadata.matches(filters)
+
+    # Checks if server can be found by query, same as search index does
+    def matches_query(self, server, query):
+        text, filters = self.parse_query(query)
+        if filters:
+            self.update_profile_metadata()
+            if not self.matches_filters(server, filters):
+                return False
+        return any(token.startswith(text) for token in ServerIndex.get_tokens(server))
+
+    # Returns servers of the given list group ("reg", "st" or "mp") and type (udp/tcp) matching search query
+    # In fuzzy mode only up to limit servers with names most similar to the query are returned
+    def search(self, query, group, server_type, fuzzy=False, limit=None):
+        self.load_server_list()
+        text, filters = self.parse_query(query.lower() if query else "")
+        if filters:
+            self.update_profile_metadata()
+        if fuzzy and self.has_search_text(query):
+            return self.fuzzy_search(text, group, server_type, limit, filters)
+        # Catalog may be updated by a background refresh
+        with self.catalog_lock:
+            results = [
+                self.search_index[conn_type].search(text)
+                for conn_type in self.server_groups.get(group, [])
+                if server_type in conn_type.lower()
+            ]
+        if len(results) == 1:
+            servers = [server for _, server in results[0]]
+        else:
+            servers = [server for _, server in heapq.merge(*results, key=lambda r: r[0])]
+        if filters:
+            servers = [server for server in servers if self.matches_filters(server, filters)]
+        return servers
+
+    # Returns up to limit servers whose names are most similar to text, best match first
+    def fuzzy_search(self, text, group, server_type, limit=None, filters=()):
+        self.load_server_list()
+        with self.catalog_lock:
+            conn_types = [c for c in self.server_groups.get(group, []) if server_type in c.lower()]
+            limit = limit or sum(len(self.search_index[conn_type]) for conn_type in conn_types)
+            matches = sorted(
+                ((score, conn_type, name_id)
+                 for conn_type in conn_types for score, name_id in self.get_fuzzy_index(conn_type).search(text)),
+                key=lambda match: -match[0],
+            )
+            ranked = []
+            seen = set()
+            # Names come best first, servers of worse names are only needed until limit is reached
+            for _, same_matches in itertools.groupby(matches, key=lambda match: match[0]):
+                servers = []
+                for _, conn_type, name_id in same_matches:
+                    for token in self.fuzzy_index[conn_type].tokens[name_id]:
+                        for seq, server in self.search_index[conn_type].get_token_records(token):
+                            if seq not in seen and (not filters or self.matches_filters(server, filters)):
+                                seen.add(seq)
+                                servers.append(server)
+                # Equally good matches are ordered by frecency and latency, like exact search results
+                ranked.extend(self.get_top_servers(servers, limit - len(ranked)))
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    # Returns n-gram index over server names of the connection type, built on first use after each catalog change
+    def get_fuzzy_index(self, conn_type):
+        with self.catalog_lock:
+            if self.fuzzy_index_generation != self.catalog_generation:
+                self.fuzzy_index = {}
+                self.fuzzy_index_generation = self.catalog_generation
+            if conn_type not in self.fuzzy_index:
+                with self.stats.timed("fuzzy_index_update"):
+                    self.fuzzy_index[conn_type] = FuzzyIndex.from_server_index(self.search_index[conn_type])
+            return self.fuzzy_index[conn_type]
+
+    # Parses contents of new or changed profiles into metadata index, once per catalog change
+    def update_profile_metadata(self):
+        self.load_server_list()
+        if self.profile_metadata_generation == self.catalog_generation:
+            return
+        with self.catalog_lock:
+            if self.profile_metadata_generation == self.catalog_generation:
+                return
+            with self.stats.timed("profile_metadata_update"):
+                changed = self.profile_metadata.update(self.surfshark_dir_path, self.all_servers)
+            self.profile_metadata_generation = self.catalog_generation
+            if changed:
+                self.schedule_catalog_save(self.catalog_profiles_mtime)
+
+    # Returns (host, port, proto) of the first remote in ovpn profile, None if not found
+    def get_profile_remote(self, profile_name, scan=True):
+        metadata = self.profile_metadata.get(profile_name)
+        if not metadata and scan:
+            metadata = self.profile_metadata.scan(self.surfshark_dir_path, profile_name)
+        return metadata.remotes[0] if metadata and metadata.remotes else None
+
+    # Returns target to measure latency of server with
+    def get_probe_target(self, profile_name):
+        # Servers usually drop unauthenticated UDP packets, so prefer the handshake of the matching TCP profile
+        if profile_name.endswith("_udp.ovpn"):
+            tcp_remote = self.get_profile_remote(profile_name[:-len("_udp.ovpn")] + "_tcp.ovpn")
+            if tcp_remote:
+                return tcp_remote
+        return self.get_profile_remote(profile_name)
+
+    # Measures latency of the provided servers that have no fresh measurement, or of all of them if forced
+    def probe_server_latency(self, servers, force=False):
+        self.update_profile_metadata()
+        targets = {}
+        for server in servers:
+            target = self.get_probe_target(server.server_profile)
+            if target and target[0] not in targets and (force or self.latency_prober.is_stale(target[0])):
+                targets[target[0]] = target
+        with self.stats.timed("latency_probe"):
+            self.latency_prober.probe(targets.values())
+
+    # Measures latency of servers on a background thread, if not already measuring
+    def schedule_latency_probe(self, servers):
+        with self.latency_lock:
+            if self.latency_thread and self.latency_thread.is_alive():
+                return
+            self.latency_thread = threading.Thread(
+                target=self.probe_server_latency, args=(list(servers),), name="SurfLatencyProbe", daemon=True
+            )
+            self.latency_thread.start()
+
+    # Measures rtt to remote of profile, without touching latencies of the server list
+    def probe_tunnel_rtt(self, profile_name):
+        target = self.get_probe_target(profile_name)
+        return LatencyProber().probe([target]).get(target[0]) if target else None
+
+    # Returns measured latency of server in seconds, None if unknown or unreachable
+    def get_latency(self, server):
+        # Only measured servers have a latency, so profiles are not scanned here
+        target = self.get_profile_remote(server.server_profile, scan=False)
+        if server.server_profile.endswith("_udp.ovpn"):
+            target = self.get_profile_remote(server.server_profile[:-len("_udp.ovpn")] + "_tcp.ovpn", scan=False) or target
+        return self.latency_prober.get_latency(target[0]) if target else None
+
+    # Orders servers by measured latency, servers without measurement keep their order at the end
+    def rank_by_latency(self, servers):
+        def rank(server):
+            latency = self.get_latency(server)
+            return (latency is None, latency or 0)
+        return sorted(servers, key=rank)
+
+    # Returns up to count servers to list first: most used ones by frecency, then the ones with lowest latency
+    def get_top_servers(self, servers, count):
+        count = len(servers) if count is None else count
+        frequent = self.usage.get_top(servers, count)
+        frequent_profiles = {s.server_profile for s in frequent}
+
+        def rank(server):
+            latency = self.get_latency(server)
+            return (latency is None, latency or 0)
+        # Same order as rank_by_latency, without sorting all servers
+        return frequent + heapq.nsmallest(
+            count - len(frequent), (s for s in servers if s.server_profile not in frequent_profiles), key=rank
+        )
+
+    # Returns up to count most used servers of list group ("reg", "st" or "mp") and type, without loading server lists
+    def get_frequent_servers(self, group, server_type, count):
+        servers = []
+        for profile in self.usage.get_ranked_profiles():
+            if len(servers) == count:
+                break
+            if (self.get_server_group(profile) != group
+                    or server_type not in self.get_conn_type_from_profile_name(profile).lower()
+                    or not os.path.isfile(os.path.join(self.surfshark_dir_path, profile))):
+                continue
+            servers.append(self.populate_server_object(self.get_server_details(profile), profile))
+        return servers
+
+    # Returns reachable regular server with the lowest latency for udp/tcp, None if none is reachable
+    def get_fastest_server(self, server_type):
+        servers = self.search(None, "reg", server_type)
+        self.probe_server_latency(servers)
+        ranked = self.rank_by_latency(servers)
+        if ranked and self.get_latency(ranked[0]) is not None:
+            return ranked[0]
+        return None
+
+    # Connect to regular server with the lowest latency
+    def connect_fastest(self, server_type):
+        self.connect_cancelled.clear()
+        server = self.get_fastest_server(server_type)
+        if not server:
+            Utils.notify(
+                "No reachable server found.",
+                "Check your network connection and try refreshing the server list.",
+                channel="connection",
+            )
+            return
+        self.connect_server(server["server_profile"])
+
+    # Returns True if server failed to connect recently and its back-off delay is not over yet
+    def is_backed_off(self, server_profile):
+        backoff = self.server_backoff.get(server_profile)
+        return bool(backoff) and backoff[1] > time.monotonic()
+
+    # Resets back-off of server after a successful connect, extends it after a failed one
+    def record_connect_result(self, server_profile, connected):
+        if connected:
+            self.server_backoff.pop(server_profile, None)
+            return
+        failures = self.server_backoff.get(server_profile, (0, 0))[0] + 1
+        delay = min(self.backoff_delay * 2 ** (failures - 1), self.max_backoff_delay)
+        self.server_backoff[server_profile] = (failures, time.monotonic() + delay)
+
+    # Returns up to failover_candidates servers to try, ordered by latency, servers in back-off last
+    def get_failover_candidates(self, servers):
+        ranked = self.rank_by_latency(servers)
+        candidates = [s for s in ranked if not self.is_backed_off(s.server_profile)]
+        # Retry servers in back-off only when nothing else is left, those whose delay ends first
+        if len(candidates) < self.failover_candidates:
+            backed_off = [s for s in ranked if self.is_backed_off(s.server_profile)]
+            candidates.extend(sorted(backed_off, key=lambda s: self.server_backoff[s.server_profile][1]))
+        return candidates[:self.failover_candidates]
+
+    # Connects to the first reachable of the candidate servers, falling back to the next one on failure
+    def connect_with_failover(self, servers):
+        if not self.is_installed():
+            return False
+        self.connect_cancelled.clear()
+        deadline = time.monotonic() + self.failover_budget
+        candidates = self.get_failover_candidates(servers)
+        # Fresh reachability check of all candidates at once, unreachable ones are not worth a connect
+        self.probe_server_latency(candidates, force=True)
+        healthy = self.rank_by_latency([s for s in candidates if self.get_latency(s) is not None])
+        if not healthy:
+            Utils.notify(
+                "No reachable server found.",
+                "Check your network connection and try refreshing the server list.",
+                channel="connection",
             )
-        )
-
-        self.st_servers = self.populate_server_object_list(temp_list)
-        temp_list.clear()
+            return False
 
-        # load multipoint servers list
-        temp_list = list(
-            filter(
-                lambda s: 'mp0' in s, self.all_servers
+        for attempt, server in enumerate(healthy, 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if self.connect_cancelled.is_set():
+                return False
+            server_details = self.get_server_details(server.server_profile)
+            Utils.notify(
+                f'Connecting to {server_details["country"]} - {server_details["city"]} ({attempt}/{len(healthy)})...',
+                "Connecting you to Surfshark.",
+                channel="connection",
             )
+            state = self.establish_connection(server.server_profile, min(self.connect_timeout, remaining))
+            if state == self.NOT_AUTHORIZED:
+                # Next attempts would only ask for the password again
+                self.notify_not_authorized()
+                return False
+            if state == self.CANCELLED:
+                return False
+            if state == "CONNECTED":
+                Utils.notify(
+                    f'Connected to {server_details["country"]} - {server_details["city"]}.',
+                    "Connected to Surfshark VPN.",
+                    channel="connection",
+                )
+                return True
+            if state == ManagementClient.AUTH_FAILED:
+                # Other servers would reject the same credentials
+                break
+
+        Utils.notify(
+            "Error connecting to Surfshark.",
+            "Make sure to provide Surfshark service-credentails in extension settings.",
+            channel="connection",
         )
-        # Add special mp server profiles
-        temp_list.extend(self.special_server_profiles)
-        self.mp_servers = self.populate_server_object_list(temp_list)
-    
-    # Connect to server using ovpn profile
+        return False
+
+    def notify_not_authorized(self):
+        Utils.notify(
+            "Connection cancelled.",
+            "Administrator privileges are needed to start OpenVPN.",
+            channel="connection",
+        )
+
+    # Starts openvpn with the profile and a management socket, returns client connected to it or None
+    # Raises PermissionError if the admin password prompt was dismissed or refused
+    def start_openvpn(self, server):
+        try:
+            os.remove(self.management_socket_path) # left behind by a previous connection
+        except OSError:
+            None
+        command = " ".join(shlex.quote(arg) for arg in [
+            self.installed_path,
+            "--config", os.path.join(self.surfshark_dir_path, server),
+            "--auth-user-pass", self.config_file_path,
+            "--management", self.management_socket_path, "unix",
+            # Socket is created by root, only the current user may control openvpn through it
+            "--management-client-user", getpass.getuser(),
+        ])
+        # Need to run command in new bash and background to avoid locking extension
+        #os.system(f"bash -lc \"pkexec {self.installed_path} --config {self.surfshark_dir_path}/{server} --auth-user-pass {self.config_file_path}\" </dev/null &>/dev/null &")
+        # Socket is owned by root, hand it to the user pkexec was called by once openvpn has created it
+        socket_path = shlex.quote(self.management_socket_path)
+        attempts = max(1, int(self.management_timeout / 0.05))
+        exit_code = sp.call(["pkexec", "bash", "-lc",
+            f"{command} </dev/null &>/dev/null & "
+            f"for attempt in $(seq {attempts}); do "
+            f"if [ -S {socket_path} ]; then chown \"$PKEXEC_UID\" {socket_path}; break; fi; sleep 0.05; done"])
+        if exit_code in self.pkexec_denied_codes:
+            raise PermissionError(f"pkexec exited with {exit_code}")
+
+        client = ManagementClient(self.management_socket_path)
+        if not client.connect_when_ready(self.management_timeout):
+            return None
+        return client
+
+    # Connect to server using ovpn profile, returns True once connected
     def connect(self, server):
-        if not self.is_installed():
-            return
+        self.connect_cancelled.clear()
+        return self.connect_server(server)
+
+    # Connects to server unless cancelled, returns True once connected
+    def connect_server(self, server):
+        if not self.is_installed() or self.connect_cancelled.is_set():
+            return False
         server_details = self.get_server_details(server)
         Utils.notify(
             f'Connecting to {server_details["country"]} - {server_details["city"]}...',
             "Connecting you to Surfshark.",
+            channel="connection",
         )
-        # Need to run command in new bash and background to avoid locking extension
-        #os.system(f"bash -lc \"pkexec {self.installed_path} --config {self.surfshark_dir_path}/{server} --auth-user-pass {self.config_file_path}\" </dev/null &>/dev/null &")
-        sp.call(["pkexec", "bash", "-lc", f"{self.installed_path} --config {self.surfshark_dir_path}/{server} --auth-user-pass {self.config_file_path} &"])
-        time.sleep(2)
-        if (self.get_status()):
+        state = self.establish_connection(server, self.connect_timeout)
+        if state == self.NOT_AUTHORIZED:
+            self.notify_not_authorized()
+            return False
+        if state == self.CANCELLED:
+            # Disconnect queued behind the connect reports the outcome
+            return False
+
+        if state == "CONNECTED":
             Utils.notify(
                 f'Connected to {server_details["country"]} - {server_details["city"]}.',
                 "Connected to Surfshark VPN.",
+                channel="connection",
             )
-        else:
-            Utils.notify(
-                f'Error connecting to {server_details["country"]} - {server_details["city"]}.',
-                "Make sure to provide Surfshark service-credentails in extension settings.",
-            )
+            return True
+
+        Utils.notify(
+            f'Error connecting to {server_details["country"]} - {server_details["city"]}.',
+            "Make sure to provide Surfshark service-credentails in extension settings.",
+            channel="connection",
+        )
+        return False
+
+    # Starts openvpn with the profile and waits for it to connect, returns the last openvpn state seen
+    def establish_connection(self, server, timeout):
+        state = None
+        try:
+            client = self.start_openvpn(server)
+        except PermissionError:
+            # Nothing was started, which says nothing about the server
+            return self.NOT_AUTHORIZED
+        if client:
+            try:
+                state = client.watch_state()
+                if state != "CONNECTED":
+                    state = self.wait_for_connection(client, timeout)
+                if state not in ("CONNECTED", "EXITING"):
+                    # Do not leave openvpn retrying in background after reporting an error
+                    client.send_signal("SIGTERM")
+            except OSError:
+                state = None
+            finally:
+                client.close()
+        self.status_provider.invalidate()
+        # Rejected credentials and cancelled connects say nothing about the server
+        if state not in (ManagementClient.AUTH_FAILED, self.CANCELLED):
+            self.record_connect_result(server, state == "CONNECTED")
+        return state
+
+    # Waits for openvpn to connect or exit, returns its state, None on timeout or CANCELLED if cancelled meanwhile
+    def wait_for_connection(self, client, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.connect_cancelled.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            state = client.wait_for_state({"CONNECTED", "EXITING"}, min(remaining, self.cancel_poll_interval))
+            if state:
+                return state
+        return self.CANCELLED
+
+    # Stops a connect in progress, openvpn it started is stopped by the connecting thread
+    def cancel_connect(self):
+        self.connect_cancelled.set()
+
+    # Stops openvpn through its management socket, returns False if it could not be reached
+    def stop_openvpn(self):
+        client = ManagementClient(self.management_socket_path)
+        try:
+            client.connect()
+            client.watch_state()
+            if not client.send_signal("SIGTERM"):
+                return False
+            # Connection closes once openvpn has exited
+            client.wait_for_state(set(), self.management_timeout)
+            return client.closed
+        except OSError:
+            return False
+        finally:
+            client.close()
+
+    # Kills openvpn processes, for connections started without management socket
+    def kill_openvpn(self):
+        ovpn_process_ids = [str(pid) for pid, _ in self.status_provider.find_processes()]
+        if not ovpn_process_ids:
+            return
+        sp.call(["pkexec", "kill"] + ovpn_process_ids)
+        deadline = time.monotonic() + self.management_timeout
+        while self.status_provider.find_processes() and time.monotonic() < deadline:
+            time.sleep(0.05)
 
     # Disconnects openvpn connection, if any 
     def disconnect(self):
@@ -246,20 +2341,23 @@ class Surf:
         Utils.notify(
             "Disconnecting...",
             "Disconnecting you from Surfshark.",
+            channel="connection",
         )
         #os.system(f"pgrep -f {self.installed_path}\ --config | pkexec xargs kill ")
-        ovpn_process_id = sp.Popen(["pgrep", "-f", f"{self.installed_path} --config"], stdout=sp.PIPE)
-        sp.call(["pkexec", "xargs", "kill"], stdin=ovpn_process_id.stdout)
-        time.sleep(2)
+        if not self.stop_openvpn():
+            self.kill_openvpn()
+        self.status_provider.invalidate()
         if not self.get_status():
             Utils.notify(
                 "Disconnected.",
                 "Disconnected from Surfshark VPN.",
+                channel="connection",
             )
         else:
             Utils.notify(
                 "Error while disconnecting.",
                 "There was an error while disconnecting from Surfshark VPN.",
+                channel="connection",
             )
 
     # extracts connection type from profile name and returns in user-friendly text
@@ -284,73 +2382,587 @@ class Surf:
     
     # Provides the status of VPN connection - returns server details object if connected
     def get_status(self):
-        connected_server_profile = sp.getoutput(f"pgrep -af {self.installed_path}\ --config | awk '{{print $4}}' | awk -F/ '{{print $NF}}' ")
-        if (connected_server_profile):
-            return self.populate_server_object(self.get_server_details(connected_server_profile), connected_server_profile)
+        with self.stats.timed("get_status"):
+            connected_server_profile = self.status_provider.get_connected_profile()
+            if (connected_server_profile):
+                # Throughput and latency are sampled while connection status is being looked at
+                self.tunnel_sampler.start(connected_server_profile)
+                return self.populate_server_object(self.get_server_details(connected_server_profile), connected_server_profile)
         
+        self.tunnel_sampler.stop()
         return None
     
-    # Removes all ovpn profiles from server_profile folder and re-download them from Surfshark
+    # Returns ETag and Last-Modified headers of the last downloaded profile archive
+    def load_download_state(self):
+        try:
+            with open(self.download_state_path, "r") as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+
+    def save_download_state(self, state):
+        try:
+            with open(self.download_state_path, "w") as state_file:
+                json.dump(state, state_file)
+        except OSError:
+            None # Next refresh just downloads the full archive again
+
+    # Streams profile archive into a spooled buffer, returns (archive, download state) or None if archive is unchanged
+    # since last download. Download state is only saved by the caller once the archive has been applied
+    def download_configurations(self):
+        request = urllib.request.Request(self.configurations_url)
+        state = self.load_download_state()
+        # Conditional download only makes sense if the previous profiles are still there
+        if self.all_servers and os.listdir(self.surfshark_dir_path):
+            if state.get("etag"):
+                request.add_header("If-None-Match", state["etag"])
+            if state.get("last_modified"):
+                request.add_header("If-Modified-Since", state["last_modified"])
+
+        archive = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                shutil.copyfileobj(response, archive, 64 * 1024)
+                headers = response.headers
+                # Chunked reads end quietly when the connection drops early
+                expected_length = headers.get("Content-Length")
+                if expected_length and expected_length.isdigit() and archive.tell() < int(expected_length):
+                    raise http.client.IncompleteRead(b"", int(expected_length) - archive.tell())
+        except urllib.error.HTTPError as error:
+            archive.close()
+            if error.code == 304:
+                return None
+            raise
+        except Exception:
+            # Connection errors and cut-off downloads
+            archive.close()
+            raise
+
+        archive.seek(0)
+        return archive, {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+
+    # Extracts ovpn profiles from archive into a staging folder, returns its path and profiles whose contents changed
+    def extract_configurations(self, archive):
+        staging_path = f"{self.surfshark_dir_path}.staging"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.mkdir(staging_path)
+        changed = []
+        with zipfile.ZipFile(archive) as configurations:
+            for member in configurations.infolist():
+                # Flatten member paths, archive should never write outside of staging folder
+                profile_name = os.path.basename(member.filename)
+                if member.is_dir() or not profile_name.endswith(".ovpn"):
+                    continue
+                contents = configurations.read(member)
+                digest = hashlib.sha1(contents).digest()
+                target_path = os.path.join(staging_path, profile_name)
+                if self.link_unchanged_profile(profile_name, digest, target_path):
+                    self.stats.count("refresh_profiles", "unchanged")
+                    continue
+                with open(target_path, "wb") as target:
+                    target.write(contents)
+                if profile_name in self.profile_manifest.entries:
+                    self.stats.count("refresh_profiles", "changed")
+                    changed.append(profile_name)
+                else:
+                    self.stats.count("refresh_profiles", "added")
+        return staging_path, changed
+
+    # Links current profile into staging folder if its contents are unchanged, returns False if it has to be written
+    def link_unchanged_profile(self, profile_name, digest, target_path):
+        if not self.profile_manifest.is_unchanged(self.surfshark_dir_path, profile_name, digest):
+            return False
+        # Linked file keeps its inode and mtime, so manifest and metadata index entries stay valid
+        try:
+            os.link(os.path.join(self.surfshark_dir_path, profile_name), target_path)
+        except OSError:
+            return False
+        return True
+
+    # Replaces server_profile folder with staging folder, refuses to replace profiles with an empty folder
+    def swap_profiles_folder(self, staging_path):
+        if not any(name.endswith(".ovpn") for name in os.listdir(staging_path)):
+            raise OSError("downloaded archive contains no server profiles")
+        if not os.path.exists(self.surfshark_dir_path):
+            os.rename(staging_path, self.surfshark_dir_path)
+            return
+        # Folder is never missing when both folders can be exchanged in one step
+        if Utils.exchange_paths(staging_path, self.surfshark_dir_path):
+            shutil.rmtree(staging_path, ignore_errors=True)
+            return
+
+        previous_path = f"{self.surfshark_dir_path}.previous"
+        shutil.rmtree(previous_path, ignore_errors=True)
+        os.rename(self.surfshark_dir_path, previous_path)
+        try:
+            os.rename(staging_path, self.surfshark_dir_path)
+        except OSError:
+            os.rename(previous_path, self.surfshark_dir_path)
+            raise
+        shutil.rmtree(previous_path, ignore_errors=True)
+
+    # Downloads ovpn profiles from Surfshark and swaps them in, keeping current profiles if anything fails
     def refresh_openvpn_connections(self):
+        self.load_server_list()
         Utils.notify(
             "Refreshing...",
             "Refreshing Surfshark VPN connection profiles.",
+            channel="refresh",
         )
-        os.system(f"rm {self.surfshark_dir_path}/*.ovpn {self.surfshark_dir_path}/configurations ")
-        os.system(f"wget https://my.surfshark.com/vpn/api/v1/server/configurations -P {self.surfshark_dir_path} ")
-        os.system(f"unzip {self.surfshark_dir_path}/configurations -d {self.surfshark_dir_path} ")
-        os.system(f"rm {self.surfshark_dir_path}/configurations ")
-        self.refresh_server_list()
+        try:
+            with self.stats.timed("refresh_download"):
+                download = self.download_configurations()
+            if download is None:
+                Utils.notify(
+                    "Refreshed.",
+                    "Surfshark VPN connection profiles are already up to date.",
+                    channel="refresh",
+                )
+                return
+            archive, download_state = download
+            with archive, self.stats.timed("refresh_extract"):
+                staging_path, changed_profiles = self.extract_configurations(archive)
+            with self.stats.timed("refresh_swap"):
+                self.swap_profiles_folder(staging_path)
+            # Conditional downloads may only skip archives that were applied
+            self.save_download_state(download_state)
+        except (OSError, zipfile.BadZipFile, http.client.HTTPException) as error:
+            shutil.rmtree(f"{self.surfshark_dir_path}.staging", ignore_errors=True)
+            Utils.notify(
+                "Error while refreshing.",
+                f"Keeping the current Surfshark VPN connection profiles ({error}).",
+                channel="refresh",
+            )
+            return
+
+        current_profiles = set(self.all_servers)
+        new_profiles = set(os.listdir(self.surfshark_dir_path))
+        with self.stats.timed("refresh_catalog_update"):
+            self.update_server_list(
+                sorted(new_profiles - current_profiles), current_profiles - new_profiles, changed_profiles
+            )
         
         Utils.notify(
             "Refreshed.",
             "Surfshark VPN connection profiles refreshed.",
+            channel="refresh",
         )
 
     # Check is credentials file is present (gets removed with extension updates)
     def is_credential_file_exists(self):
-        return os.path.exists(self.config_file_path)
+        return self.credentials.file_exists
     
     # Create and modify credentials file
     def update_credential_file(self, uname, passwd):
-        if not self.is_credential_file_exists():
-            os.system(f"echo \"\n\" > {self.config_file_path} && chmod 600 {self.config_file_path} ") # need to create two line to open stream for sed to update passowrd at line 2
-        if uname:
-            os.system(f"sed -i \"1s/.*/{uname}/\" {self.config_file_path} ")
-        if passwd:
-            os.system(f"sed -i \"2s/.*/{passwd}/\" {self.config_file_path} ")
+        self.credentials.update(uname, passwd)
 
-    def __init__(self):
+    def __init__(self, surfshark_dir_path=None, proc_root="/proc", configurations_url=None, lazy=False):
         self.installed_path = self.get_installed_path()
-        self.country_mapping = json.load(open(Utils.get_path("server_country_map.json"), "r"))
-        self.surfshark_dir_path = Utils.get_path("server_profiles")
+        self.configurations_url = configurations_url or self.configurations_url
+        self.catalog_lock = threading.RLock()
+        self.next_seq = 0 # sequence number for the next server added to search index
+        self.catalog_generation = 0 # changes whenever server lists are reloaded or updated
+        self.profiles_watcher = None
+        self.catalog_ready = threading.Event()
+        self.warm_up_thread = None
+        self.stats = Stats()
+        self.status_provider = StatusProvider(self.installed_path, proc_root, stats=self.stats)
+        self.latency_prober = LatencyProber()
+        self.latency_lock = threading.Lock()
+        self.latency_thread = None
+        self.tunnel_sampler = TunnelSampler(self.probe_tunnel_rtt)
+        self.profile_metadata = ProfileMetadataIndex() # remotes and ciphers parsed from profile contents
+        self.profile_metadata_generation = None # catalog generation profile metadata was last synced with
+        self.fuzzy_index = {} # connection type -> n-gram index over server names, for typo tolerant search
+        self.fuzzy_index_generation = None # catalog generation fuzzy indexes were built from
+        self.profile_manifest = ProfileManifest() # size, mtime and content digest of each profile
+        self.duplicate_profiles = {} # profile with the same contents as a listed profile -> listed profile
+        self.catalog_profiles_mtime = None # profiles folder mtime the catalog is current for
+        self.catalog_save_timer = None # pending write of catalog cache after profile changes
+        self.server_backoff = {} # profile name -> (consecutive failed connects, time until which it is skipped)
+        self.connect_cancelled = threading.Event() # set to stop a connect in progress
+        with open(Utils.get_path("server_country_map.json"), "rb") as mapping_file:
+            mapping_data = mapping_file.read()
+        self.mapping_hash = hashlib.sha1(mapping_data).hexdigest()
+        # Mapping is small and needed for connection status, server lists may be loaded later
+        self.country_mapping = {d["code"]: d for d in json.loads(mapping_data)}
+        self.surfshark_dir_path = surfshark_dir_path or Utils.get_path("server_profiles")
+        # Catalog cache lives next to server_profile folder
+        self.catalog_file_path = os.path.join(os.path.dirname(self.surfshark_dir_path), "server_catalog.cache")
+        self.download_state_path = os.path.join(os.path.dirname(self.surfshark_dir_path), "server_profiles_download.json")
+        self.usage = UsageStore(os.path.join(os.path.dirname(self.surfshark_dir_path), "server_usage.jsonl"))
         self.config_file_path = Utils.get_path("service_credentials.conf")
+        self.credentials = CredentialStore(self.config_file_path)
+        self.management_socket_path = Utils.get_runtime_path("surfshark-openvpn.sock")
         # In case user deletes the folder with ovpn profiles manually
         if not os.path.exists(self.surfshark_dir_path):
             os.system(f"mkdir {self.surfshark_dir_path} ")
-         
-        self.refresh_server_list()
+
+        # In lazy mode server lists are loaded by warm_up or on first use
+        if not lazy:
+            self.load_server_list()
+
+
+class Job:
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, key, title, action, args):
+        self.key = key # jobs with the same key never run or queue side by side
+        self.title = title
+        self.action = action
+        self.args = args
+        self.state = Job.PENDING
+        self.error = None
+
+    # Checks if job is still waiting or being executed
+    def is_active(self):
+        return self.state in (Job.PENDING, Job.RUNNING)
+
+
+class JobManager:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.active_jobs = {} # job key -> pending or running job
+        self.finished_jobs = collections.deque(maxlen=10)
+        self.worker = None
+
+    # Queues action to run on worker thread, returns the job or None if a job with the same key is running
+    # With interrupt, a running job with the same key is interrupted through it and the action runs right after
+    def submit(self, key, title, action, *args, interrupt=None):
+        with self.lock:
+            running_job = self.active_jobs.get(key)
+            if running_job and running_job.state == Job.PENDING:
+                # Coalesce with queued job, latest request wins
+                running_job.title, running_job.action, running_job.args = title, action, args
+                return running_job
+            rejected = bool(running_job) and not interrupt
+            if not rejected:
+                job = Job(key, title, action, args)
+                self.active_jobs[key] = job
+                self.queue.put(job)
+                self.start_worker()
+
+        if rejected:
+            Utils.notify(f"{running_job.title} already in progress.", "Please wait for it to finish.")
+            return None
+        if running_job:
+            interrupt()
+        return job
+
+    # Starts worker thread if not running, must be called with lock held
+    def start_worker(self):
+        if self.worker and self.worker.is_alive():
+            return
+        self.worker = threading.Thread(target=self.run, name="SurfJobWorker", daemon=True)
+        self.worker.start()
+
+    # Executes queued jobs one at a time, so connect/disconnect/refresh never overlap
+    def run(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                job.state = Job.RUNNING
+                action, args = job.action, job.args
+            try:
+                action(*args)
+                job.state = Job.DONE
+            except Exception as error:
+                job.error = error
+                job.state = Job.FAILED
+                Utils.notify(f"{job.title} failed.", str(error))
+            with self.lock:
+                # A job queued behind this one may hold the key already
+                if self.active_jobs.get(job.key) is job:
+                    del self.active_jobs[job.key]
+                self.finished_jobs.append(job)
+            self.queue.task_done()
+
+    # Returns jobs that are pending or running
+    def get_active_jobs(self):
+        with self.lock:
+            return list(self.active_jobs.values())
+
+
+class QueryDispatcher:
+    def __init__(self, debounce=0.05):
+        self.debounce = debounce # seconds to wait for a newer query when queries arrive faster than this
+        self.lock = threading.Lock()
+        self.evaluation_lock = threading.Lock() # queries are evaluated one at a time
+        self.latest_token = 0
+        self.latest_time = 0
+
+    # Registers a new query, returns token identifying it
+    def submit(self):
+        with self.lock:
+            now = time.monotonic()
+            self.latest_token += 1
+            typing_fast = now - self.latest_time < self.debounce
+            self.latest_time = now
+            return self.latest_token, typing_fast
+
+    # Checks if a newer query was submitted after the one with given token
+    def is_stale(self, query_token):
+        return query_token[0] != self.latest_token
+
+    # Waits for a burst of queries to settle, returns False if query got superseded meanwhile
+    def settle(self, query_token):
+        # A query after a pause is evaluated right away
+        if query_token[1]:
+            time.sleep(self.debounce)
+        return not self.is_stale(query_token)
+
+
+class DaemonError(Exception):
+    None # Request was received by daemon but failed there
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    # Answers JSON requests, one per line, for as long as the client keeps the connection open
+    def handle(self):
+        for line in self.rfile:
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                response = {"id": request_id, "result": self.server.call(request["method"], request.get("params") or {})}
+            except Exception as error:
+                response = {"id": request_id, "error": str(error)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class SurfDaemon(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, surf, socket_path):
+        self.surf = surf
+        self.connection_lock = threading.Lock() # held while connecting or disconnecting, requests are handled concurrently
+        self.methods = {
+            "catalog": self.get_catalog,
+            "search": self.search,
+            "status": self.get_status,
+            "connect": self.connect,
+            "disconnect": self.disconnect,
+            "cancel": self.cancel_connect,
+        }
+        # Socket of a daemon that did not exit cleanly
+        if os.path.exists(socket_path) and not DaemonClient.is_running(socket_path):
+            os.remove(socket_path)
+        super(SurfDaemon, self).__init__(socket_path, DaemonRequestHandler)
+
+    # Creates socket accessible to current user only
+    def server_bind(self):
+        umask = os.umask(0o177)
+        try:
+            super(SurfDaemon, self).server_bind()
+        finally:
+            os.umask(umask)
+
+    # Runs API method with request params
+    def call(self, method, params):
+        if method not in self.methods:
+            raise DaemonError(f"Unknown method: {method}")
+        return self.methods[method](**params)
+
+    # Returns catalog generation and server count per connection type
+    def get_catalog(self):
+        self.surf.load_server_list()
+        return {
+            "generation": self.surf.catalog_generation,
+            "servers": {conn_type: len(index) for conn_type, index in self.surf.search_index.items()},
+        }
+
+    # Returns servers matching query, ranked the same way the server list of the extension is
+    def search(self, query="", group="reg", server_type="udp", limit=None, fuzzy=False):
+        servers = self.surf.search(query, group, server_type, fuzzy=fuzzy, limit=limit)
+        if not query:
+            self.surf.schedule_latency_probe(servers)
+        # Fuzzy matches are already ranked by similarity
+        ranked = servers[:limit] if fuzzy and self.surf.has_search_text(query) else self.surf.get_top_servers(servers, limit)
+        return [dict(server.to_dict(), latency=self.surf.get_latency(server)) for server in ranked]
+
+    # Returns connected server and tunnel samples, None if not connected
+    def get_status(self):
+        server = self.surf.get_status()
+        if not server:
+            return None
+        return {"server": server.to_dict(), "tunnel": self.surf.tunnel_sampler.get_summary()}
+
+    # Connects to server profile, returns True once connected
+    # Same rules as the job queue of the extension, a connect is rejected while another one is in progress
+    def connect(self, server):
+        if not self.connection_lock.acquire(blocking=False):
+            raise DaemonError("Connecting already in progress")
+        try:
+            connected = self.surf.connect(server)
+        finally:
+            self.connection_lock.release()
+        # Failed and cancelled connects do not count towards usage ranking
+        if connected:
+            self.surf.usage.record(server)
+        return connected
+
+    # Disconnects once a connect in progress is cancelled, returns True if disconnected
+    def disconnect(self):
+        if self.connection_lock.locked():
+            self.surf.cancel_connect()
+        with self.connection_lock:
+            self.surf.disconnect()
+            return self.surf.get_status() is None
+
+    # Cancels a connect in progress, so a disconnect does not have to wait for it
+    def cancel_connect(self):
+        self.surf.cancel_connect()
+        return True
+
+    # Serves API until interrupted, catalog is loaded and kept updated in background
+    def run(self):
+        self.surf.warm_up()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            self.surf.save_pending_catalog()
+            os.remove(self.server_address)
+
+
+class DaemonClient:
+    def __init__(self, socket_path, timeout=5.0):
+        self.socket_path = socket_path
+        self.timeout = timeout # seconds to wait for replies of requests returning right away
+        self.lock = threading.Lock()
+        self.sock = None
+        self.reader = None
+        self.request_id = 0
+
+    # Checks if a daemon answers on socket path
+    @staticmethod
+    def is_running(socket_path):
+        client = DaemonClient(socket_path, timeout=1.0)
+        try:
+            client.call("catalog")
+            return True
+        except (OSError, ValueError, DaemonError):
+            return False
+        finally:
+            client.close()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+    def close(self):
+        if self.reader:
+            self.reader.close()
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    # Sends request over the persistent connection and returns its result
+    # Reconnects once if a reused connection was dropped before the request was sent
+    def call(self, method, timeout=None, **params):
+        with self.lock:
+            for attempt in range(2):
+                reused = self.sock is not None
+                if not reused:
+                    self.connect()
+                self.request_id += 1
+                try:
+                    self.sock.settimeout(timeout or self.timeout)
+                    self.sock.sendall(json.dumps({"id": self.request_id, "method": method, "params": params}).encode() + b"\n")
+                except OSError:
+                    self.close()
+                    # Daemon may have been restarted since the last request, it did not get this one
+                    if attempt or not reused:
+                        raise
+                    continue
+                try:
+                    line = self.reader.readline()
+                    if not line:
+                        raise ConnectionResetError("Daemon closed the connection")
+                except OSError:
+                    # Request may still be running or may have run, sending it again could repeat it
+                    self.close()
+                    raise
+                response = json.loads(line)
+                if "error" in response:
+                    raise DaemonError(response["error"])
+                return response["result"]
 
 
 class SurfExtension(Extension):
+    query_cache_size = 64 # number of recent server queries to keep results for
+    daemon_retry_interval = 10 # seconds between checks for a daemon that was not running
     keyword = None
     max_server_entries = None
+    fuzzy_search = False # rank servers by name similarity, tolerating typos and missing accents
     uname = None
     passwd = None
 
-    def __init__(self):
+    # Without use_daemon, server lists are always searched and connected to in this process
+    def __init__(self, surf=None, use_daemon=True):
         super(SurfExtension, self).__init__()
         self.subscribe(KeywordQueryEvent, KeywordQueryEventListener())
         self.subscribe(ItemEnterEvent, ItemEnterEventListener())
         self.subscribe(PreferencesEvent, PreferencesEventListener())
         self.subscribe(PreferencesUpdateEvent, PreferencesUpdateEventListener())
-        self.surf = Surf()
+        # Listeners are registered first, server lists are loaded in background
+        self.surf = surf or Surf(lazy=True)
+        self.jobs = JobManager()
+        self.use_daemon = use_daemon # look for a surf daemon serving the catalog
+        self.daemon = None # client of surf daemon serving the catalog, if one is running
+        self.daemon_checked = None # time daemon was last looked for
+        # Server lists of a running daemon are already warm
+        if not self.get_daemon():
+            self.surf.warm_up()
+        self.query_cache = collections.OrderedDict() # (connection type, query) -> matched servers and items
+        self.query_cache_generation = None
+        self.query_dispatcher = QueryDispatcher()
+        self.surf.credentials.start_watching()
     
+    # Returns client of surf daemon if one is running, looking for it again at most every daemon_retry_interval
+    def get_daemon(self):
+        if self.daemon or not self.use_daemon:
+            return self.daemon
+        now = time.monotonic()
+        if self.daemon_checked is not None and now - self.daemon_checked < self.daemon_retry_interval:
+            return None
+        self.daemon_checked = now
+        client = DaemonClient(Utils.get_runtime_path("surfshark-daemon.sock"))
+        try:
+            client.connect()
+        except OSError:
+            return None
+        self.daemon = client
+        return client
+
+    # Stops using daemon that stopped answering, server lists are loaded in this process instead
+    def drop_daemon(self):
+        if self.daemon:
+            self.daemon.close()
+        self.daemon = None
+        self.daemon_checked = time.monotonic()
+        self.surf.warm_up()
+
+    # Checks if server lists can be searched without waiting
+    def is_catalog_ready(self):
+        return bool(self.get_daemon()) or self.surf.is_ready()
+
     # Update service credentials
     def update_credentials(self):
         if not self.surf.is_credential_file_exists():
-            self.update_username(self.uname)
-            self.update_password(self.passwd)
+            self.surf.update_credential_file(self.uname, self.passwd)
 
     def update_username(self, uname):
         self.surf.update_credential_file(uname, None)
@@ -359,64 +2971,316 @@ class SurfExtension(Extension):
         self.surf.update_credential_file(None, passwd)
     # End update service credentials
     
-    # Filters the provided server list based on search query and server type 
-    def filter_server_list(self, query, server_type, server_list):
+    # Filters the provided server list group based on search query and server type 
+    def filter_server_list(self, query, server_type, server_group):
         # Not the best logic, but ensures that service-credentails file is present before user tries to connect to a VPN server
         self.update_credentials()
-        query = query.lower() if query else ""
-        if query:
-            return [s for s in server_list if ((s["country"].lower().startswith(query) 
-                                                    or s["alt_word"].lower().startswith(query) 
-                                                    or s["city"].lower().startswith(query))
-                                     and server_type in s["conn_type"].lower())]
-        else:
-            return [s for s in server_list if server_type in s["conn_type"].lower()]
+        with self.surf.stats.timed("filter_server_list"):
+            return self.surf.search(query, server_group, server_type, fuzzy=self.fuzzy_search, limit=self.max_server_entries)
     
+    # Returns cached results of a server query, narrowing results of a cached shorter query if possible
+    def get_query_results(self, query, server_type):
+        # Cached results are only valid for the catalog they were computed from
+        if self.query_cache_generation != self.surf.catalog_generation:
+            self.query_cache.clear()
+            self.query_cache_generation = self.surf.catalog_generation
+
+        cache_key = (server_type, query)
+        results = self.query_cache.get(cache_key)
+        if results:
+            self.surf.stats.count("query_cache", "hit")
+            self.query_cache.move_to_end(cache_key)
+            # Not the best logic, but ensures that service-credentails file is present before user tries to connect to a VPN server
+            self.update_credentials()
+            return results
+
+        prefix_results = None
+        # Fuzzy results of a shorter query are only its best matches, not all candidates
+        lengths = () if self.fuzzy_search else range(len(query) - 1, 0, -1)
+        for length in lengths:
+            prefix_results = self.query_cache.get((server_type, query[:length]))
+            if prefix_results and self.surf.is_narrowing_query(query, query[:length]):
+                break
+            prefix_results = None
+
+        if prefix_results:
+            # Query extends a cached query, only its matches can match
+            self.surf.stats.count("query_cache", "narrowed")
+            self.update_credentials()
+            servers = [s for s in prefix_results["servers"] if self.surf.matches_query(s, query)]
+        else:
+            group, protocol = self.surf.get_group_and_protocol(server_type)
+            self.surf.stats.count("query_cache", "miss")
+            servers = self.filter_server_list(query, protocol, group)
+
+        results = {"servers": servers, "items": None}
+        self.query_cache[cache_key] = results
+        if len(self.query_cache) > self.query_cache_size:
+            self.query_cache.popitem(last=False)
+        return results
+
     # Returns servers based on server query and connection type selected
     def get_server_result_items(self, query, server_type):
         #server_type = (server_type.lower() + ".ovpn") if server_type else "udp.ovpn"
         server_type = server_type.lower() if server_type else "udp"
-        items = []
-        data = []
-        
-        # multihop connections
-        if server_type.startswith('mp'):
-            server_type = server_type.replace('mp_', '')
-            data = self.filter_server_list(query, server_type, self.surf.mp_servers)
-            
-        # static ip connections
-        elif server_type.startswith('st'):
-            server_type = server_type.replace('st_', '')
-            data = self.filter_server_list(query, server_type, self.surf.st_servers)
+        query = query.lower() if query else ""
+        daemon_items = self.get_daemon_result_items(query, server_type)
+        if daemon_items is not None:
+            return daemon_items
+        results = self.get_query_results(query, server_type)
 
-        # regular connections
+        # Measure latencies in background when server list is opened, rank by what is measured so far
+        if not query:
+            self.surf.schedule_latency_probe(results["servers"])
+        # Ranking changes with new latency measurements and recorded connections
+        items_key = (self.surf.latency_prober.generation, self.surf.usage.generation, self.max_server_entries)
+        if results["items"] and results["items"][0] == items_key:
+            return list(results["items"][1])
+
+        # Show only first n servers (default 10), fuzzy matches are already ranked by similarity
+        if self.fuzzy_search and self.surf.has_search_text(query):
+            servers = results["servers"][:self.max_server_entries]
         else:
-            data = self.filter_server_list(query, server_type, self.surf.reg_servers)
-            
-        # Show only first n servers (default 10)
-        for server in data[0:self.max_server_entries]:
+            servers = self.surf.get_top_servers(results["servers"], self.max_server_entries)
+        items = [self.get_server_result_item(server, self.surf.get_latency(server)) for server in servers]
+        results["items"] = (items_key, items)
+        return list(items)
+
+    # Returns server items ranked by daemon, None if no daemon is reachable
+    def get_daemon_result_items(self, query, server_type):
+        daemon = self.get_daemon()
+        if not daemon:
+            return None
+        # Daemon connects using the same service-credentails file
+        self.update_credentials()
+        group, protocol = self.surf.get_group_and_protocol(server_type)
+        try:
+            servers = daemon.call(
+                "search", query=query, group=group, server_type=protocol, limit=self.max_server_entries, fuzzy=self.fuzzy_search
+            )
+        except (OSError, ValueError, DaemonError):
+            self.drop_daemon()
+            return None
+        return [self.get_server_result_item(ServerRecord.from_dict(s), s["latency"]) for s in servers]
+
+    # Returns item connecting to the server, with its latency if measured
+    def get_server_result_item(self, server, latency):
+        return ExtensionResultItem(
+            icon=Utils.get_path(f'images/flags/{server["flag_file"]}'),
+            name=server["country"] + " - " + server["city"],
+            description=(f"{latency * 1000:.0f} ms" if latency is not None else ""),
+            highlightable=False,
+            on_enter=ExtensionCustomAction(
+                {
+                    "action": "CONNECT_TO_SERVER",
+                    "server": server["server_profile"],
+                }
+            ),
+        )
+
+    # Returns items of most used servers of the connection type, available before server lists are loaded
+    def get_frequent_result_items(self, server_type):
+        group, protocol = self.surf.get_group_and_protocol(server_type.lower())
+        return [
+            self.get_server_result_item(server, self.surf.get_latency(server))
+            for server in self.surf.get_frequent_servers(group, protocol, self.max_server_entries or 10)
+        ]
+
+    # Returns item connecting to the best server matching the query, falling back to the next ones on failure
+    def get_failover_result_item(self, query, server_type):
+        candidate_count = min(self.surf.failover_candidates, self.max_server_entries or self.surf.failover_candidates)
+        return ExtensionResultItem(
+            icon=Utils.get_path("images/icon.svg"),
+            name=f'Best server for "{query}"',
+            description=f"Connect to the first reachable of the top {candidate_count} servers, trying the next one on failure",
+            highlightable=False,
+            on_enter=ExtensionCustomAction(
+                {
+                    "action": "CONNECT_FAILOVER",
+                    "query": query,
+                    "server_type": server_type,
+                }
+            ),
+        )
+
+    # Connects to one of the servers matching the query, trying the next candidate on failure
+    def connect_with_failover(self, query, server_type):
+        group, protocol = self.surf.get_group_and_protocol(server_type.lower())
+        servers = self.filter_server_list(query.lower(), protocol, group)
+        self.surf.connect_with_failover(servers)
+
+    # Returns items to connect to the fastest server, for udp/tcp matching the query
+    def get_fastest_result_items(self, query):
+        items = []
+        query = query.lower() if query else ""
+        for server_type in ("udp", "tcp"):
+            if not server_type.startswith(query):
+                continue
+            servers = self.surf.rank_by_latency(self.surf.search(None, "reg", server_type))
+            fastest = servers[0] if servers and self.surf.get_latency(servers[0]) is not None else None
             items.append(
                 ExtensionResultItem(
-                    icon=Utils.get_path(f'images/flags/{server["flag_file"]}'),
-                    name=server["country"] + " - " + server["city"],
+                    icon=Utils.get_path(f'images/flags/{fastest["flag_file"]}' if fastest else "images/icon.svg"),
+                    name=f"Fastest {server_type.upper()} server",
+                    description=(
+                        f'Currently {fastest["country"]} - {fastest["city"]} ({self.surf.get_latency(fastest) * 1000:.0f} ms)'
+                        if fastest else "Measure latency of all servers and connect to the fastest one"
+                    ),
                     highlightable=False,
                     on_enter=ExtensionCustomAction(
                         {
-                            "action": "CONNECT_TO_SERVER",
-                            "server": server["server_profile"],
+                            "action": "CONNECT_FASTEST",
+                            "server_type": server_type,
                         }
                     ),
                 )
             )
         return items
     
-    # Returns server details object to which VPN is connected, if any
+    # Returns items with latency of each measured stage and hit rate of each cache
+    def get_stats_result_items(self):
+        stats = self.surf.stats
+        stats.flush()
+        items = []
+        for stage, sample_count, p50, p95, maximum in stats.get_latency_summary():
+            items.append(
+                ExtensionResultItem(
+                    icon=Utils.get_path("images/icon.svg"),
+                    name=stage,
+                    description=f"p50 {p50 * 1000:.2f} ms | p95 {p95 * 1000:.2f} ms | max {maximum * 1000:.2f} ms ({sample_count} samples)",
+                    highlightable=False,
+                    on_enter=SetUserQueryAction(
+                        f'{self.keyword or " "} stats'
+                    ),
+                )
+            )
+        for cache_name, hit_rate, counter in stats.get_cache_summary():
+            items.append(
+                ExtensionResultItem(
+                    icon=Utils.get_path("images/icon.svg"),
+                    name=(f"{cache_name}: {hit_rate * 100:.0f}% hits" if hit_rate is not None else cache_name),
+                    description=", ".join(f"{outcome} {count}" for outcome, count in sorted(counter.items())),
+                    highlightable=False,
+                    on_enter=SetUserQueryAction(
+                        f'{self.keyword or " "} stats'
+                    ),
+                )
+            )
+        if not items:
+            items.append(
+                ExtensionResultItem(
+                    icon=Utils.get_path("images/icon.svg"),
+                    name="No statistics recorded yet.",
+                    description="Use the extension for a while and come back.",
+                    highlightable=False,
+                    on_enter=SetUserQueryAction(
+                        f'{self.keyword or " "} '
+                    ),
+                )
+            )
+        return items
+
+    # Returns server details object to which VPN is connected and its tunnel samples, (None, None) if not connected
     def get_connection_status(self):
-        return self.surf.get_status()
+        daemon = self.get_daemon()
+        if daemon:
+            try:
+                status = daemon.call("status")
+            except (OSError, ValueError, DaemonError):
+                self.drop_daemon()
+            else:
+                return (ServerRecord.from_dict(status["server"]), status["tunnel"]) if status else (None, None)
+
+        server = self.surf.get_status()
+        return (server, self.surf.tunnel_sampler.get_summary()) if server else (None, None)
+
+    # Runs long request on its own daemon connection, so queries are not blocked behind it
+    def call_daemon_once(self, daemon, method, timeout, **params):
+        client = DaemonClient(daemon.socket_path)
+        try:
+            return client.call(method, timeout=timeout, **params)
+        finally:
+            client.close()
+
+    # Connects to server profile through daemon if one is running, in this process otherwise
+    def connect(self, server):
+        daemon = self.get_daemon()
+        if daemon:
+            try:
+                # Daemon records a successful connection in usage store itself
+                return self.call_daemon_once(
+                    daemon, "connect", self.surf.connect_timeout + 4 * self.surf.management_timeout, server=server
+                )
+            except socket.timeout:
+                return False # openvpn may still be connecting in daemon, starting another one would race it
+            except (OSError, ValueError):
+                self.drop_daemon()
+        # Failed and cancelled connects do not count towards usage ranking
+        connected = self.surf.connect(server)
+        if connected:
+            self.surf.usage.record(server)
+        return connected
+
+    # Cancels a connect in progress, in the daemon too if one is running
+    def cancel_connect(self):
+        self.surf.cancel_connect()
+        daemon = self.get_daemon()
+        if daemon:
+            try:
+                self.call_daemon_once(daemon, "cancel", self.surf.management_timeout)
+            except (OSError, ValueError, DaemonError):
+                None # Daemon is gone or does not support cancelling, its connect times out by itself
+
+    # Disconnects through daemon if one is running, in this process otherwise
+    def disconnect(self):
+        daemon = self.get_daemon()
+        if daemon:
+            try:
+                self.call_daemon_once(daemon, "disconnect", 4 * self.surf.management_timeout)
+                return
+            except socket.timeout:
+                return
+            except (OSError, ValueError):
+                self.drop_daemon()
+        self.surf.disconnect()
+
+    # Returns throughput and latency of the connected tunnel, empty until sampled
+    def get_tunnel_description(self, summary):
+        parts = []
+        if summary["rx_rate"] is not None:
+            parts.append(
+                f'↓ {Utils.format_rate(summary["rx_rate"])} ↑ {Utils.format_rate(summary["tx_rate"])} '
+                f'(avg ↓ {Utils.format_rate(summary["avg_rx_rate"])} ↑ {Utils.format_rate(summary["avg_tx_rate"])})'
+            )
+        if summary["rtt"] is not None:
+            parts.append(f'{summary["rtt"] * 1000:.0f} ms (avg {summary["avg_rtt"] * 1000:.0f} ms)')
+        return " | ".join(parts)
 
 
 class KeywordQueryEventListener(EventListener):
+    # Ulauncher sends a query per keystroke, only the latest one of a burst is evaluated and rendered
     def on_event(self, event, extension):
+        dispatcher = extension.query_dispatcher
+        query_token = dispatcher.submit()
+        if not dispatcher.settle(query_token):
+            extension.surf.stats.count("query_dispatch", "superseded")
+            return None
+
+        with dispatcher.evaluation_lock:
+            action = self.render_query(event, extension, query_token)
+        if not action or dispatcher.is_stale(query_token):
+            extension.surf.stats.count("query_dispatch", "superseded")
+            return None
+
+        extension.surf.stats.count("query_dispatch", "rendered")
+        return action
+
+    # Returns results for the query, None if a newer query arrives before the expensive work
+    @Stats.timed_event("keyword_query")
+    def render_query(self, event, extension, query_token):
+        if extension.query_dispatcher.is_stale(query_token):
+            return None
+
         # Start with an empty options list
         items = []
 
@@ -425,7 +3289,7 @@ class KeywordQueryEventListener(EventListener):
                 ExtensionResultItem(
                     icon=Utils.get_path("images/icon.svg"),
                     name="Extension failed to load :/",
-                    description="Make sure to have openvpn, wget, and unzip installed on system.",
+                    description="Make sure to have openvpn installed on system.",
                     highlightable=False,
                     on_enter=HideWindowAction(),
                 )
@@ -438,15 +3302,35 @@ class KeywordQueryEventListener(EventListener):
         
         if not command:
             # First selection page
+            # Show progress of connect/disconnect/refresh running in background
+            for job in extension.jobs.get_active_jobs():
+                items.append(
+                    ExtensionResultItem(
+                        icon=Utils.get_path("images/icon.svg"),
+                        name=f"{job.title}...",
+                        description=f"Job is {job.state}.",
+                        highlightable=False,
+                        on_enter=SetUserQueryAction(
+                            f'{extension.keyword or " "} '
+                        ),
+                    )
+                )
+
             # Show Connect option only if no other openvpn connection is running
-            server_connected = extension.get_connection_status()
+            if extension.query_dispatcher.is_stale(query_token):
+                return None
+            server_connected, tunnel_summary = extension.get_connection_status()
             if server_connected:
+                tunnel_description = extension.get_tunnel_description(tunnel_summary)
                 items.extend(
                     [
                         ExtensionResultItem(
                             icon=Utils.get_path(f'images/flags/{server_connected["flag_file"]}'),
                             name="Connected",
-                            description=(server_connected["country"] + " - " + server_connected["city"] + " : " + server_connected["conn_type"]),
+                            description=(
+                                server_connected["country"] + " - " + server_connected["city"] + " : " + server_connected["conn_type"]
+                                + (f" | {tunnel_description}" if tunnel_description else "")
+                            ),
                             highlightable=False,
                             on_enter=SetUserQueryAction(
                                 f'{extension.keyword or " "} '
@@ -505,9 +3389,34 @@ class KeywordQueryEventListener(EventListener):
                     )
                 
                 
+            elif not extension.is_catalog_ready():
+                # Query arrived before server lists finished loading, usual servers do not need them
+                if not server_query:
+                    items.extend(extension.get_frequent_result_items(connection_type))
+                items.append(
+                    ExtensionResultItem(
+                        icon=Utils.get_path("images/icon.svg"),
+                        name="Loading servers...",
+                        description="Server list is being loaded, try again in a moment.",
+                        highlightable=False,
+                        on_enter=SetUserQueryAction(
+                            f'{extension.keyword or " "} connect {connection_type} {server_query or ""}'
+                        ),
+                    )
+                )
+
+            elif connection_type == "fastest":
+                # Fastest server page
+                items.extend(extension.get_fastest_result_items(server_query))
+
             else:
                 # Server selection page
+                if extension.query_dispatcher.is_stale(query_token):
+                    return None
                 server_list = extension.get_server_result_items(server_query, connection_type)
+                if server_query and len(server_list) > 1:
+                    # One action for flaky locations instead of retrying servers by hand
+                    items.append(extension.get_failover_result_item(server_query, connection_type))
                 if server_list:
                     items.extend(server_list)
                 else:
@@ -524,6 +3433,10 @@ class KeywordQueryEventListener(EventListener):
                             ),
                         ]
                     )
+
+        elif command == "stats":
+            # Diagnostics page
+            items.extend(extension.get_stats_result_items())
                 
         else:
             # invalid keyword sequence
@@ -545,6 +3458,7 @@ class KeywordQueryEventListener(EventListener):
 
 
 class ItemEnterEventListener(EventListener):
+    @Stats.timed_event("item_enter")
     def on_event(self, event, extension):
         data = event.get_data()
         action = data["action"]
@@ -552,14 +3466,24 @@ class ItemEnterEventListener(EventListener):
         if action == "CONNECT":
             return RenderResultListAction(extension.get_server_result_items())
 
+        # Long running actions are executed by the job worker to keep queries responsive
         if action == "DISCONNECT":
-            return extension.surf.disconnect()
+            # Disconnect stops a connect in progress and runs right after it
+            extension.jobs.submit("connection", "Disconnecting", extension.disconnect, interrupt=extension.cancel_connect)
 
         if action == "REFRESHDB":
-            return extension.surf.refresh_openvpn_connections()
+            extension.jobs.submit("refresh", "Refreshing", extension.surf.refresh_openvpn_connections)
 
         if action == "CONNECT_TO_SERVER":
-            return extension.surf.connect(data["server"])
+            extension.jobs.submit("connection", "Connecting", extension.connect, data["server"])
+
+        if action == "CONNECT_FASTEST":
+            extension.jobs.submit("connection", "Connecting", extension.surf.connect_fastest, data["server_type"])
+
+        if action == "CONNECT_FAILOVER":
+            extension.jobs.submit(
+                "connection", "Connecting", extension.connect_with_failover, data["query"], data["server_type"]
+            )
 
 
 class PreferencesEventListener(EventListener):
@@ -571,6 +3495,8 @@ class PreferencesEventListener(EventListener):
             extension.max_server_entries = int(event.preferences["surf_max_entry"])
         except ValueError:
             extension.max_server_entries = 10   # default to 10 entries
+        extension.surf.stats.log_path = event.preferences.get("surf_stats_log") or None
+        extension.fuzzy_search = event.preferences.get("surf_fuzzy_search") == "yes"
         
 
 class PreferencesUpdateEventListener(EventListener):
@@ -588,6 +3514,90 @@ class PreferencesUpdateEventListener(EventListener):
                 extension.max_server_entries = int(event.new_value)
             except ValueError:
                 extension.max_server_entries = 10   # default to 10 entries
+        if event.id == "surf_stats_log":
+            extension.surf.stats.flush()
+            extension.surf.stats.log_path = event.new_value or None
+        if event.id == "surf_fuzzy_search":
+            extension.fuzzy_search = event.new_value == "yes"
+            # Cached results were matched in the other mode
+            extension.query_cache.clear()
+
+# Runs surf daemon or a command line request against it, e.g. python main.py search germany --type tcp
+def main(args):
+    parser = argparse.ArgumentParser(description="Surfshark VPN daemon and command line client")
+    parser.add_argument("--daemon", action="store_true", help="serve catalog, search, status and connections over a unix socket")
+    parser.add_argument("--socket", default=Utils.get_runtime_path("surfshark-daemon.sock"), help="daemon socket path")
+    parser.add_argument("--type", default="udp", help="connection type: udp, tcp, st_udp, st_tcp, mp_udp or mp_tcp")
+    parser.add_argument("--limit", type=int, default=10, help="max servers listed by search")
+    parser.add_argument("--fuzzy", action="store_true", help="search by name similarity, tolerating typos")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("command", nargs="?", choices=["catalog", "search", "status", "connect", "disconnect"])
+    parser.add_argument("argument", nargs="*", help="search query or server profile to connect to")
+    args = parser.parse_args(args)
+
+    if args.daemon:
+        try:
+            daemon = SurfDaemon(Surf(lazy=True), args.socket)
+        except OSError as error:
+            if error.errno != errno.EADDRINUSE:
+                raise
+            sys.stderr.write(f"Surf daemon already running on {args.socket}\n")
+            return 1
+        try:
+            daemon.run()
+        except KeyboardInterrupt:
+            None # Socket is removed by run
+        return 0
+    if not args.command:
+        parser.error("a command or --daemon is required")
+
+    client = DaemonClient(args.socket, timeout=Surf.connect_timeout + 4 * Surf.management_timeout)
+    params = {}
+    if args.command == "search":
+        group, protocol = Surf.get_group_and_protocol(args.type.lower())
+        params = {
+            "query": " ".join(args.argument).lower(),
+            "group": group,
+            "server_type": protocol,
+            "limit": args.limit,
+            "fuzzy": args.fuzzy,
+        }
+    elif args.command == "connect":
+        if not args.argument:
+            parser.error("connect requires a server profile, as listed by search")
+        params = {"server": args.argument[0]}
+    try:
+        result = client.call(args.command, **params)
+    except (OSError, ValueError) as error:
+        sys.stderr.write(f"Surf daemon is not reachable on {args.socket} ({error}), start it with --daemon\n")
+        return 2
+    except DaemonError as error:
+        sys.stderr.write(f"{error}\n")
+        return 1
+    finally:
+        client.close()
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    elif args.command == "catalog":
+        for conn_type, count in sorted(result["servers"].items()):
+            print(f"{conn_type}: {count} servers")
+    elif args.command == "search":
+        for server in result:
+            latency = f'{server["latency"] * 1000:.0f} ms' if server["latency"] is not None else "-"
+            print(f'{server["country"]} - {server["city"]}\t{latency}\t{server["server_profile"]}')
+    elif args.command == "status":
+        if result:
+            print(f'Connected: {result["server"]["country"]} - {result["server"]["city"]} : {result["server"]["conn_type"]}')
+        else:
+            print("Not connected")
+    else:
+        print("Done." if result else "Failed.")
+    return 0 if result or args.command in ("status", "search") else 1
+
 
 if __name__ == "__main__":
+    # Ulauncher starts the extension without arguments
+    if len(sys.argv) > 1:
+        sys.exit(main(sys.argv[1:]))
     SurfExtension().run()
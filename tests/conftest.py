@@ -0,0 +1,11 @@
+# Makes main.py importable without Ulauncher, using the stand-in modules of the benchmark
+import os
+import sys
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_PATH)
+sys.path.insert(0, os.path.join(REPO_PATH, "benchmarks"))
+
+from benchmark import install_stub_modules
+
+install_stub_modules()
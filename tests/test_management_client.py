@@ -0,0 +1,123 @@
+# ManagementClient against a stand-in openvpn management socket
+import os
+import socket
+import threading
+
+import pytest
+
+from main import ManagementClient
+
+STATE_REPLY = "1700000000,CONNECTED,SUCCESS,10.8.0.2,2001:db8::1,1194,,,fd00::2"
+
+
+# Serves one management connection: answers commands with scripted lines, then pushes or closes
+class StandInOpenvpn:
+    def __init__(self, socket_path, replies, after_state=(), close_after_state=False):
+        self.replies = replies # command -> lines sent back
+        self.after_state = after_state # real-time messages pushed once "state" was answered
+        self.close_after_state = close_after_state
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(socket_path)
+        self.server.listen(1)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        connection, _ = self.server.accept()
+        with connection, connection.makefile("rb") as commands:
+            for command in commands:
+                command = command.decode().strip()
+                lines = list(self.replies.get(command, ["ERROR: unknown command"]))
+                if command == "state":
+                    lines += self.after_state
+                connection.sendall("".join(line + "\r\n" for line in lines).encode())
+                if command == "state" and self.close_after_state:
+                    break
+
+    def close(self):
+        self.server.close()
+        self.thread.join(1)
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return os.path.join(str(tmp_path), "management.sock")
+
+
+def connect_client(socket_path):
+    client = ManagementClient(socket_path, timeout=2.0)
+    assert client.connect_when_ready(2.0)
+    return client
+
+
+def get_replies(state_reply=STATE_REPLY, notifications=()):
+    return {
+        # Real-time messages may arrive between a command and its reply
+        "state on": list(notifications) + ["SUCCESS: real-time state notification set to ON"],
+        "state": [state_reply, "END"],
+        "signal SIGTERM": ["SUCCESS: signal SIGTERM thrown"],
+    }
+
+
+def test_parse_state_with_ipv6_addresses():
+    assert ManagementClient.parse_state(STATE_REPLY) == "CONNECTED"
+    assert ManagementClient.parse_state(">STATE:" + STATE_REPLY) == "CONNECTED"
+    assert ManagementClient.parse_state("fd00::2") is None
+
+
+def test_watch_state_reply_with_ipv6_addresses(socket_path):
+    openvpn = StandInOpenvpn(socket_path, get_replies())
+    client = connect_client(socket_path)
+    try:
+        assert client.watch_state() == "CONNECTED"
+        assert client.send_signal("SIGTERM")
+    finally:
+        client.close()
+        openvpn.close()
+
+
+def test_wait_for_state_uses_queued_notifications(socket_path):
+    replies = get_replies("1700000000,WAIT,,,,,,", [">STATE:1700000001,CONNECTED,SUCCESS,10.8.0.2,2001:db8::1,1194,,"])
+    openvpn = StandInOpenvpn(socket_path, replies)
+    client = connect_client(socket_path)
+    try:
+        assert client.watch_state() == "WAIT"
+        assert client.wait_for_state({"CONNECTED"}, 1.0) == "CONNECTED"
+    finally:
+        client.close()
+        openvpn.close()
+
+
+def test_wait_for_state_reports_auth_failed(socket_path):
+    replies = get_replies("1700000000,AUTH,,,,,,")
+    openvpn = StandInOpenvpn(socket_path, replies, after_state=[">PASSWORD:Verification Failed: 'Auth'"])
+    client = connect_client(socket_path)
+    try:
+        assert client.watch_state() == "AUTH"
+        assert client.wait_for_state({"CONNECTED"}, 1.0) == ManagementClient.AUTH_FAILED
+    finally:
+        client.close()
+        openvpn.close()
+
+
+def test_wait_for_state_reports_exiting_when_openvpn_goes_away(socket_path):
+    replies = get_replies("1700000000,RECONNECTING,,,,,,")
+    openvpn = StandInOpenvpn(socket_path, replies, close_after_state=True)
+    client = connect_client(socket_path)
+    try:
+        assert client.watch_state() == "RECONNECTING"
+        assert client.wait_for_state({"CONNECTED"}, 1.0) == "EXITING"
+    finally:
+        client.close()
+        openvpn.close()
+
+
+def test_wait_for_state_times_out(socket_path):
+    openvpn = StandInOpenvpn(socket_path, get_replies("1700000000,WAIT,,,,,,"))
+    client = connect_client(socket_path)
+    try:
+        assert client.watch_state() == "WAIT"
+        assert client.wait_for_state({"CONNECTED"}, 0.2) is None
+    finally:
+        client.close()
+        openvpn.close()
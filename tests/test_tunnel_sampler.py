@@ -0,0 +1,77 @@
+# TunnelSampler counters and summary against a temporary net_dev file
+from unittest import mock
+
+import pytest
+
+from main import TunnelSampler
+
+NET_DEV_HEADER = (
+    "Inter-|   Receive                                                |  Transmit\n"
+    " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n"
+)
+
+
+def write_net_dev(path, interfaces):
+    lines = [
+        f"{name:>6}: {rx} 10 0 0 0 0 0 0 {tx} 12 0 0 0 0 0 0\n" for name, rx, tx in interfaces
+    ]
+    path.write_text(NET_DEV_HEADER + "".join(lines))
+
+
+@pytest.fixture
+def net_dev(tmp_path):
+    return tmp_path / "dev"
+
+
+def create_sampler(net_dev, rtts=()):
+    rtts = iter(rtts)
+    return TunnelSampler(lambda profile_name: next(rtts, None), net_dev_path=str(net_dev), rtt_interval=2)
+
+
+def test_read_counters_sums_tunnel_interfaces(net_dev):
+    write_net_dev(net_dev, [("lo", 500, 500), ("tun0", 1000, 200), ("eth0", 9000, 9000), ("tun1", 24, 6)])
+    assert create_sampler(net_dev).read_counters() == (1024, 206)
+
+
+def test_read_counters_without_tunnel(net_dev):
+    write_net_dev(net_dev, [("lo", 500, 500), ("eth0", 9000, 9000)])
+    assert create_sampler(net_dev).read_counters() is None
+    assert create_sampler(net_dev.parent / "missing").read_counters() is None
+
+
+def test_summary_before_samples(net_dev):
+    summary = create_sampler(net_dev).get_summary()
+    assert set(summary) == {"rx_rate", "tx_rate", "avg_rx_rate", "avg_tx_rate", "rtt", "avg_rtt"}
+    assert all(value is None for value in summary.values())
+
+
+def test_summary_rates_and_rtt(net_dev):
+    sampler = create_sampler(net_dev, rtts=[0.04, 0.02])
+    sampler.profile_name = "de-fra.prod.surfshark.com_udp.ovpn"
+    with mock.patch("main.time.monotonic", side_effect=[10.0, 12.0, 14.0, 14.5]):
+        for rx, tx in [(1000, 100), (3000, 500), (7000, 600)]:
+            write_net_dev(net_dev, [("tun0", rx, tx)])
+            sampler.sample()
+        summary = sampler.get_summary()
+
+    assert summary["rx_rate"] == pytest.approx(2000)
+    assert summary["tx_rate"] == pytest.approx(50)
+    assert summary["avg_rx_rate"] == pytest.approx(1500)
+    assert summary["avg_tx_rate"] == pytest.approx(125)
+    # Rtt is probed on the first and third sample
+    assert summary["rtt"] == pytest.approx(0.02)
+    assert summary["avg_rtt"] == pytest.approx(0.03)
+
+
+def test_summary_restarts_when_counters_reset(net_dev):
+    sampler = create_sampler(net_dev)
+    with mock.patch("main.time.monotonic", side_effect=[10.0, 12.0, 14.0, 16.0, 16.5]):
+        for rx, tx in [(1000, 100), (3000, 500), (200, 10), (600, 30)]:
+            write_net_dev(net_dev, [("tun0", rx, tx)])
+            sampler.sample()
+        summary = sampler.get_summary()
+
+    assert summary["rx_rate"] == pytest.approx(200)
+    assert summary["avg_rx_rate"] == pytest.approx(200)
+    assert summary["avg_tx_rate"] == pytest.approx(10)
+    assert summary["rtt"] is None